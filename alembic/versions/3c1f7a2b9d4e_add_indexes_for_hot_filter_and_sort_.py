@@ -0,0 +1,56 @@
+"""Add indexes for hot filter and sort columns
+
+Revision ID: 3c1f7a2b9d4e
+Revises: 0ba698cbecdb
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f7a2b9d4e'
+down_revision: Union[str, None] = '0ba698cbecdb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, columns) matching the query shapes in database.py
+INDEXES = [
+    # get_posts / get_published_posts_* / get_recent_entries: published, newest first
+    ('ix_posts_published_updated', 'posts', ['is_published', 'updated_at', 'id']),
+    # same, filtered by category
+    ('ix_posts_published_category_updated', 'posts', ['is_published', 'category', 'updated_at', 'id']),
+    # search_posts*: published, ordered by created_at
+    ('ix_posts_published_created', 'posts', ['is_published', 'created_at', 'id']),
+    # get_pages(published_only=True)
+    ('ix_pages_published_created', 'pages', ['is_published', 'created_at']),
+    # get_lines(gauge_type=..., status=...)
+    ('ix_lines_gauge_type_status', 'lines', ['gauge_type', 'status']),
+    ('ix_lines_status', 'lines', ['status']),
+    ('ix_lines_updated_at', 'lines', ['updated_at']),
+    # get_stations(station_type=..., city_id=..., province=...)
+    ('ix_stations_station_type', 'stations', ['station_type']),
+    ('ix_stations_city_id', 'stations', ['city_id']),
+    ('ix_stations_province', 'stations', ['province']),
+    ('ix_stations_updated_at', 'stations', ['updated_at']),
+    # get_projects(status=...) and per-city/category lookups
+    ('ix_projects_status', 'projects', ['status']),
+    ('ix_projects_city_id', 'projects', ['city_id']),
+    ('ix_projects_category_id', 'projects', ['category_id']),
+    ('ix_projects_updated_at', 'projects', ['updated_at']),
+    # get_recent_entries
+    ('ix_cities_updated_at', 'cities', ['updated_at']),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
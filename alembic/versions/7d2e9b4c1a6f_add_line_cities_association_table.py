@@ -0,0 +1,53 @@
+"""Add line_cities association table
+
+Revision ID: 7d2e9b4c1a6f
+Revises: 3c1f7a2b9d4e
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e9b4c1a6f'
+down_revision: Union[str, None] = '3c1f7a2b9d4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    line_cities = op.create_table('line_cities',
+    sa.Column('line_id', sa.Integer(), nullable=False),
+    sa.Column('city_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['line_id'], ['lines.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['city_id'], ['cities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('line_id', 'city_id')
+    )
+    op.create_index('ix_line_cities_city_id', 'line_cities', ['city_id', 'line_id'], unique=False)
+
+    # Backfill from the comma-separated lines.cities_served column
+    connection = op.get_bind()
+    city_ids = {
+        name.strip().lower(): city_id
+        for city_id, name in connection.execute(sa.text("SELECT id, name FROM cities"))
+    }
+    rows = []
+    for line_id, cities_served in connection.execute(
+        sa.text("SELECT id, cities_served FROM lines WHERE cities_served IS NOT NULL")
+    ):
+        served = {name.strip().lower() for name in cities_served.split(",") if name.strip()}
+        rows.extend(
+            {'line_id': line_id, 'city_id': city_ids[name]}
+            for name in served
+            if name in city_ids
+        )
+    if rows:
+        op.bulk_insert(line_cities, rows)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_line_cities_city_id', table_name='line_cities')
+    op.drop_table('line_cities')
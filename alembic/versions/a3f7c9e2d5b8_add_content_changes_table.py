@@ -0,0 +1,36 @@
+"""Add content_changes table
+
+The ids of the rows each content_versions bump covered, so other worker
+processes can update their in-memory indexes row by row instead of
+rebuilding them. Starts empty: a worker that finds a gap in it rebuilds.
+
+Revision ID: a3f7c9e2d5b8
+Revises: f2d6a8c4b1e7
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f7c9e2d5b8'
+down_revision: Union[str, None] = 'f2d6a8c4b1e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'content_changes',
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('entity_type', 'version', 'entity_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('content_changes')
@@ -0,0 +1,56 @@
+"""Add excerpt to posts
+
+Revision ID: a8f3c5e1d7b2
+Revises: 7d2e9b4c1a6f
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+import html
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8f3c5e1d7b2'
+down_revision: Union[str, None] = '7d2e9b4c1a6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same rules as database.make_excerpt() at the time of this migration
+EXCERPT_LENGTH = 150
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def make_excerpt(content):
+    if not content:
+        return ""
+    text = " ".join(html.unescape(TAG_RE.sub(" ", content)).split())
+    if len(text) > EXCERPT_LENGTH:
+        text = text[:EXCERPT_LENGTH].rstrip() + "..."
+    return text
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('excerpt', sa.String(length=200), nullable=True))
+
+    # Backfill from the existing HTML content
+    connection = op.get_bind()
+    posts = sa.table('posts', sa.column('id', sa.Integer), sa.column('excerpt', sa.String))
+    rows = [
+        {'post_id': post_id, 'excerpt': make_excerpt(content)}
+        for post_id, content in connection.execute(sa.text("SELECT id, content FROM posts"))
+    ]
+    if rows:
+        connection.execute(
+            posts.update()
+            .where(posts.c.id == sa.bindparam('post_id'))
+            .values(excerpt=sa.bindparam('excerpt')),
+            rows,
+        )
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'excerpt')
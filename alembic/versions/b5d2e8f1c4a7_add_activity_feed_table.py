@@ -0,0 +1,81 @@
+"""Add activity_feed table
+
+One row per published post, line, station, project and city with the title,
+URL and updated_at the "recent entries" sidebar shows. BlogDatabase keeps it
+current on every write; this migration fills it from the existing rows.
+
+Revision ID: b5d2e8f1c4a7
+Revises: e4b7d1c9a3f6
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2e8f1c4a7'
+down_revision: Union[str, None] = 'e4b7d1c9a3f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same titles and URLs as database.activity_entry() at the time of this migration
+FEED_SOURCES = {
+    'post': "SELECT id, title, NULL AS slug, updated_at, created_at FROM posts WHERE is_published",
+    'line': "SELECT id, line_number, NULL AS slug, updated_at, created_at FROM lines",
+    'station': "SELECT id, name, NULL AS slug, updated_at, created_at FROM stations",
+    'project': "SELECT id, title, NULL AS slug, updated_at, created_at FROM projects",
+    'city': "SELECT id, name, slug, updated_at, created_at FROM cities",
+}
+
+
+def feed_entry(entity_type, entity_id, title, slug, updated_at, created_at):
+    if entity_type == 'post':
+        url = f'/post/{entity_id}'
+    elif entity_type == 'line':
+        title, url = f'Línea {title}', f'/lines/{entity_id}'
+    elif entity_type == 'station':
+        url = f'/stations/{entity_id}'
+    elif entity_type == 'project':
+        url = f'/projects/{entity_id}'
+    else:
+        url = f'/cities/{slug}' if slug else f'/cities/{entity_id}'
+    return {
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'title': title,
+        'url': url,
+        'updated_at': updated_at or created_at or datetime.utcnow(),
+    }
+
+
+def upgrade() -> None:
+    feed = op.create_table(
+        'activity_feed',
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=False),
+        sa.Column('url', sa.String(length=255), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('entity_type', 'entity_id'),
+    )
+    op.create_index('ix_activity_feed_updated_at', 'activity_feed', ['updated_at'], unique=False)
+
+    connection = op.get_bind()
+    rows = [
+        feed_entry(entity_type, *row)
+        for entity_type, query in FEED_SOURCES.items()
+        for row in connection.execute(
+            sa.text(query).columns(updated_at=sa.DateTime(), created_at=sa.DateTime())
+        )
+    ]
+    if rows:
+        op.bulk_insert(feed, rows)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_activity_feed_updated_at', table_name='activity_feed')
+    op.drop_table('activity_feed')
@@ -0,0 +1,45 @@
+"""Add content_versions table
+
+One counter per entity type, bumped by every transaction that writes rows of
+that type, so each worker process can tell which of its caches another
+worker made stale.
+
+Revision ID: c7e3a9d5b1f8
+Revises: b5d2e8f1c4a7
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e3a9d5b1f8'
+down_revision: Union[str, None] = 'b5d2e8f1c4a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same as database.CONTENT_TYPES at the time of this migration
+CONTENT_TYPES = ('post', 'page', 'line', 'station', 'project', 'event', 'city', 'category')
+
+
+def upgrade() -> None:
+    versions = op.create_table(
+        'content_versions',
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('entity_type'),
+    )
+    now = datetime.utcnow()
+    op.bulk_insert(
+        versions,
+        [{'entity_type': entity_type, 'version': 0, 'updated_at': now} for entity_type in CONTENT_TYPES],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('content_versions')
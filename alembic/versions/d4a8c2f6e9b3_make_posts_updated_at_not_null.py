@@ -0,0 +1,40 @@
+"""Make posts.updated_at NOT NULL
+
+Keyset pagination of published posts seeks on (updated_at, id), so a post
+with a NULL updated_at never shows up in it. Existing NULLs take the
+post's created_at (or now).
+
+Revision ID: d4a8c2f6e9b3
+Revises: c7e3a9d5b1f8
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8c2f6e9b3'
+down_revision: Union[str, None] = 'c7e3a9d5b1f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.get_bind().execute(
+        sa.text("UPDATE posts SET updated_at = COALESCE(created_at, :now) WHERE updated_at IS NULL"),
+        {'now': datetime.utcnow()},
+    )
+    # SQLite can only change a column by rebuilding the table, which would
+    # drop the full-text triggers on posts; the backfill above and the
+    # model's default keep the column filled there
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('posts', 'updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('posts', 'updated_at', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,80 @@
+"""Add full-text search indexes
+
+SQLite gets external-content FTS5 tables (accent-insensitive) kept in sync
+with their source table by triggers; MySQL gets FULLTEXT indexes. Other
+databases are left alone and keep substring search.
+
+Revision ID: e4b7d1c9a3f6
+Revises: a8f3c5e1d7b2
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7d1c9a3f6'
+down_revision: Union[str, None] = 'a8f3c5e1d7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same as database.FULLTEXT_COLUMNS
+FULLTEXT_COLUMNS = {
+    'posts': ('title', 'content'),
+    'lines': ('line_number', 'description'),
+    'stations': ('name', 'station_code', 'address'),
+    'projects': ('title', 'description'),
+    'cities': ('name', 'region'),
+}
+
+
+def sqlite_upgrade(table, columns):
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    op.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END"
+    )
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def sqlite_downgrade(table):
+    fts = f'{table}_fts'
+    for suffix in ('ai', 'ad', 'au'):
+        op.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+    op.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table, columns in FULLTEXT_COLUMNS.items():
+        if dialect == 'sqlite':
+            sqlite_upgrade(table, columns)
+        elif dialect == 'mysql':
+            op.create_index(f'ft_{table}', table, list(columns), unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in FULLTEXT_COLUMNS:
+        if dialect == 'sqlite':
+            sqlite_downgrade(table)
+        elif dialect == 'mysql':
+            op.drop_index(f'ft_{table}', table_name=table)
@@ -0,0 +1,52 @@
+"""Rebuild line_cities
+
+Until now only BlogDatabase's line and city methods filled line_cities, and
+matched names with SQL lower(), which leaves accented letters alone on
+SQLite. Rows written any other way (create_sample_data.py, for one) or
+naming a city such as Ávila in different case got no link; this recomputes
+every link from lines.cities_served.
+
+Revision ID: e9c1b7d3a5f2
+Revises: d4a8c2f6e9b3
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9c1b7d3a5f2'
+down_revision: Union[str, None] = 'd4a8c2f6e9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same folding as database.fold_name() at the time of this migration
+def fold_name(name):
+    return name.strip().casefold()
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    city_ids = {}
+    for city_id, name in connection.execute(sa.text("SELECT id, name FROM cities")):
+        city_ids.setdefault(fold_name(name), []).append(city_id)
+    rows = set()
+    for line_id, cities_served in connection.execute(
+        sa.text("SELECT id, cities_served FROM lines WHERE cities_served IS NOT NULL")
+    ):
+        for name in {fold_name(name) for name in cities_served.split(",") if name.strip()}:
+            rows.update((line_id, city_id) for city_id in city_ids.get(name, ()))
+
+    line_cities = sa.table('line_cities', sa.column('line_id', sa.Integer), sa.column('city_id', sa.Integer))
+    connection.execute(line_cities.delete())
+    if rows:
+        op.bulk_insert(line_cities, [{'line_id': line_id, 'city_id': city_id} for line_id, city_id in sorted(rows)])
+
+
+def downgrade() -> None:
+    # The rebuilt links are a superset of the old ones: nothing to undo
+    pass
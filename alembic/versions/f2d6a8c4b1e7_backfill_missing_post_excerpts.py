@@ -0,0 +1,60 @@
+"""Backfill missing post excerpts
+
+Posts written outside create_post/update_post (create_sample_data.py, for
+one) got no excerpt; PostModel now fills it on every write, and this fills
+the ones already stored without it.
+
+Revision ID: f2d6a8c4b1e7
+Revises: e9c1b7d3a5f2
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import html
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2d6a8c4b1e7'
+down_revision: Union[str, None] = 'e9c1b7d3a5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same rules as database.make_excerpt() at the time of this migration
+EXCERPT_LENGTH = 150
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def make_excerpt(content):
+    if not content:
+        return ""
+    text = " ".join(html.unescape(TAG_RE.sub(" ", content)).split())
+    if len(text) > EXCERPT_LENGTH:
+        text = text[:EXCERPT_LENGTH].rstrip() + "..."
+    return text
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    posts = sa.table('posts', sa.column('id', sa.Integer), sa.column('excerpt', sa.String))
+    rows = [
+        {'post_id': post_id, 'excerpt': make_excerpt(content)}
+        for post_id, content in connection.execute(
+            sa.text("SELECT id, content FROM posts WHERE excerpt IS NULL")
+        )
+    ]
+    if rows:
+        connection.execute(
+            posts.update()
+            .where(posts.c.id == sa.bindparam('post_id'))
+            .values(excerpt=sa.bindparam('excerpt')),
+            rows,
+        )
+
+
+def downgrade() -> None:
+    # Excerpts are derived data: nothing to undo
+    pass
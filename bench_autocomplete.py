@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Latency check for the autocomplete prefix index.
+
+Builds a PrefixIndex over synthetic stations, cities and lines (no
+database) and reports p50/p99 lookup times for one- to four-letter
+prefixes, the way the header search box queries it.
+
+Usage:
+    python bench_autocomplete.py [stations] [lookups]
+"""
+
+import random
+import string
+import sys
+import time
+
+from search_index import Document, PrefixIndex
+
+CITY_NAMES = [
+    "Madrid",
+    "Barcelona",
+    "Valencia",
+    "Sevilla",
+    "Zaragoza",
+    "Málaga",
+    "Córdoba",
+    "Valladolid",
+    "Bilbao",
+    "Alicante",
+    "León",
+    "Cádiz",
+    "Granada",
+    "Oviedo",
+    "Santander",
+    "Logroño",
+    "Ávila",
+    "Segovia",
+]
+
+
+def make_index(station_count):
+    random.seed(1)
+    index = PrefixIndex()
+    documents = []
+    for i, name in enumerate(CITY_NAMES):
+        documents.append(Document(("city", i), name, "", {}))
+    for i in range(station_count):
+        city = random.choice(CITY_NAMES)
+        suffix = "".join(random.choices(string.ascii_lowercase, k=6)).capitalize()
+        documents.append(
+            Document(("station", i), f"Estación {city} {suffix}", f"ST{i:05d}", {})
+        )
+    for i in range(station_count // 20):
+        documents.append(Document(("line", i), f"Línea C{i}", f"C{i}", {}))
+    index.ensure_built(lambda: documents)
+    return index
+
+
+def main():
+    station_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    started = time.perf_counter()
+    index = make_index(station_count)
+    print(f"built {len(index)} documents in {time.perf_counter() - started:.2f} s")
+
+    words = [name.lower() for name in CITY_NAMES] + ["estacion", "st0", "c1"]
+    prefixes = [random.choice(words)[: random.randint(1, 4)] for _ in range(lookups)]
+    timings = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.lookup(prefix)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[int(len(timings) * 0.99)] * 1000
+    print(f"{lookups} lookups: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the compiled row mappers in database.py.
+
+Compares building Post/Line/Station objects the old way (keyword coercions
+plus full Pydantic validation) against the compiled ``*_from_row`` mappers
+(no validation) on in-memory ORM rows.
+
+Usage:
+    python bench_row_mappers.py [rows] [repeat]
+"""
+
+import sys
+import timeit
+from datetime import datetime
+
+from database import (
+    PostModel,
+    LineModel,
+    StationModel,
+    post_from_row,
+    line_from_row,
+    station_from_row,
+)
+from models import Post, Line, Station, PostCategory
+
+
+def validated_post(post):
+    return Post(
+        id=int(post.id),
+        title=str(post.title),
+        content=str(post.content),
+        author=str(post.author),
+        is_published=bool(post.is_published),
+        category=PostCategory(post.category) if post.category else None,
+        created_at=post.created_at,
+        updated_at=post.updated_at,
+    )
+
+
+def validated_line(line):
+    return Line(
+        id=int(line.id),
+        line_number=str(line.line_number),
+        description=str(line.description),
+        status=str(line.status),
+        gauge_type=str(line.gauge_type) if line.gauge_type else None,
+        cities_served=line.cities_served.split(",") if line.cities_served else [],
+        category_id=line.category_id,
+        created_at=line.created_at,
+        updated_at=line.updated_at,
+    )
+
+
+def validated_station(station):
+    return Station(
+        id=int(station.id),
+        station_code=str(station.station_code),
+        name=str(station.name),
+        address=str(station.address),
+        services=station.services.split(",") if station.services else [],
+        accessibility=station.accessibility.split(",") if station.accessibility else [],
+        station_type=str(station.station_type) if station.station_type else None,
+        province=str(station.province) if station.province else None,
+        city_id=station.city_id,
+        created_at=station.created_at,
+        updated_at=station.updated_at,
+    )
+
+
+def make_rows(count):
+    now = datetime.utcnow()
+    posts = [
+        PostModel(
+            id=i,
+            title=f"Post {i}",
+            content="<p>" + "Contenido del artículo. " * 40 + "</p>",
+            author="Redacción",
+            is_published=True,
+            category="noticias",
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+    lines = [
+        LineModel(
+            id=i,
+            line_number=f"C{i}",
+            description="Línea de cercanías",
+            status="active",
+            gauge_type="iberico",
+            cities_served="Madrid,Guadalajara,Alcalá de Henares",
+            category_id=1,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+    stations = [
+        StationModel(
+            id=i,
+            station_code=f"ST{i}",
+            name=f"Estación {i}",
+            address="Plaza de la Estación, s/n",
+            services="wifi,cafeteria,parking",
+            accessibility="rampa,ascensor",
+            station_type="principal",
+            province="Madrid",
+            city_id=1,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+    return posts, lines, stations
+
+
+def bench(label, func, rows, repeat):
+    best = min(
+        timeit.repeat(lambda: [func(row) for row in rows], number=1, repeat=repeat)
+    )
+    per_row_us = best / len(rows) * 1e6
+    print(f"  {label:<12} {best * 1000:8.2f} ms  ({per_row_us:.2f} us/row)")
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    posts, lines, stations = make_rows(count)
+
+    print(f"{count} rows, best of {repeat}")
+    for name, rows, validated, compiled in [
+        ("Post", posts, validated_post, post_from_row),
+        ("Line", lines, validated_line, line_from_row),
+        ("Station", stations, validated_station, station_from_row),
+    ]:
+        print(name)
+        slow = bench("validated", validated, rows, repeat)
+        fast = bench("compiled", compiled, rows, repeat)
+        print(f"  speedup      {slow / fast:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+"""
+Small caches for reference data and pages read on most requests.
+
+``CacheBackend`` is what callers program against: a bounded map whose
+entries expire after a fixed number of seconds, with hit/miss counters and
+an atomic ``get_or_set``; ``get_stale`` can also hand back an entry that
+expired a little while ago. ``TTLCache`` keeps the entries in this process;
+``SQLiteCache`` keeps them in a SQLite file that every worker on the host
+opens, so they share one copy. ``SingleFlight`` and
+``AsyncSingleFlight`` let concurrent callers asking for the same key share
+one computation, so an expired entry is recomputed once, not once per
+caller. None of them know about the database: BlogDatabase decides what to
+cache and drops entries when the rows behind them change.
+"""
+
+import abc
+import asyncio
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CacheBackend(abc.ABC):
+    """Interface of the caches below. Keys are hashable, values anything a
+    backend can store (SQLiteCache pickles them)."""
+
+    ttl: float
+    maxsize: int
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The cached value for ``key``, or ``default`` (counted as a miss)"""
+        return self.get_stale(key, 0, default)[0]
+
+    @abc.abstractmethod
+    def get_stale(
+        self, key: Hashable, max_stale: float, default: Any = None
+    ) -> Tuple[Any, bool]:
+        """``(value, stale)`` for ``key``, like ``get`` but also returning an
+        entry that expired less than ``max_stale`` seconds ago, flagged stale"""
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: Hashable, value: Any): ...
+
+    @abc.abstractmethod
+    def get_or_set(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """The cached value for ``key``, or ``fn()`` stored under it. Callers
+        missing together get one value: the first one stored."""
+        ...
+
+    @abc.abstractmethod
+    def invalidate(self, key: Hashable): ...
+
+    @abc.abstractmethod
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]):
+        """Drop every entry for which ``predicate(key, value)`` is true"""
+        ...
+
+    @abc.abstractmethod
+    def clear(self): ...
+
+    @abc.abstractmethod
+    def stats(self) -> dict: ...
+
+
+class TTLCache(CacheBackend):
+    """LRU cache of at most ``maxsize`` entries, each valid for ``ttl`` seconds.
+
+    Safe to share between threads. ``generation`` changes on every
+    invalidation: a value loaded before an invalidation is stale, so
+    ``set`` is given the generation read before loading and ignores the
+    value if it has moved on.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The cached value for ``key``, or ``default`` (counted as a miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def get_stale(
+        self, key: Hashable, max_stale: float, default: Any = None
+    ) -> Tuple[Any, bool]:
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and entry[0] + max_stale > now:
+                self._entries.move_to_end(key)
+                stale = entry[0] <= now
+                if stale:
+                    self.stale_hits += 1
+                else:
+                    self.hits += 1
+                return entry[1], stale
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default, False
+
+    def set(self, key: Hashable, value: Any, generation: int = None):
+        """Cache ``value``, unless invalidated since ``generation`` was read"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        def load():
+            generation = self.generation
+            value = fn()
+            self.set(key, value, generation)
+            return value
+
+        # An expired entry is recomputed once, however many callers missed
+        return self._flights.do(key, load)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]):
+        with self._lock:
+            self.generation += 1
+            for key in [k for k, (_, v) in self._entries.items() if predicate(k, v)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SQLiteCache(CacheBackend):
+    """Cache of at most ``maxsize`` entries, each valid for ``ttl`` seconds,
+    kept in the SQLite file at ``path``.
+
+    Every process opening the same file and ``namespace`` shares the
+    entries; evicting goes by last use, which is recorded at most every
+    ``touch_interval`` seconds per entry to keep reads from writing. Values
+    are pickled, so the file must only be writable by the app's own user.
+    Counters in ``stats`` are this process's. The calls block on the file:
+    run them off the event loop. A lookup or ``set`` that can't get the
+    file's lock within ``busy_timeout`` seconds is a miss or is dropped,
+    rather than holding the request up.
+    """
+
+    touch_interval = 1.0
+    busy_timeout = 0.5
+
+    def __init__(self, path: str, namespace: str, ttl: float, maxsize: int = 256):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, entry BLOB NOT NULL, "
+                "expires REAL NOT NULL, used REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_entries_used "
+                "ON cache_entries (namespace, used)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads: one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """A write transaction, holding the file's write lock from the start"""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _store(self, db: sqlite3.Connection, key: Hashable, value: Any, now: float):
+        db.execute(
+            "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)",
+            (
+                self.namespace,
+                repr(key),
+                pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL),
+                now + self.ttl,
+                now,
+            ),
+        )
+        (size,) = db.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        if size > self.maxsize:
+            db.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? "
+                "ORDER BY used LIMIT ?)",
+                (self.namespace, self.namespace, size - self.maxsize),
+            )
+            with self._lock:
+                self.evictions += size - self.maxsize
+
+    def get_stale(
+        self, key: Hashable, max_stale: float, default: Any = None
+    ) -> Tuple[Any, bool]:
+        db = self._connection()
+        now = time.time()
+        try:
+            row = db.execute(
+                "SELECT entry, expires, used FROM cache_entries "
+                "WHERE namespace = ? AND key = ?",
+                (self.namespace, repr(key)),
+            ).fetchone()
+            if row is not None and row[1] + max_stale <= now:
+                # Unless another process stored a new one meanwhile
+                db.execute(
+                    "DELETE FROM cache_entries "
+                    "WHERE namespace = ? AND key = ? AND expires = ?",
+                    (self.namespace, repr(key), row[1]),
+                )
+                row = None
+            elif row is not None and now - row[2] > self.touch_interval:
+                db.execute(
+                    "UPDATE cache_entries SET used = ? "
+                    "WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, repr(key)),
+                )
+        except sqlite3.OperationalError as e:
+            # Busy (another writer holds the lock): a miss, not an error
+            logger.warning("Cache lookup in %s failed: %s", self.path, e)
+            row = None
+        if row is None:
+            self._count("misses")
+            return default, False
+        entry, expires, _ = row
+        stale = expires <= now
+        self._count("stale_hits" if stale else "hits")
+        return pickle.loads(entry)[1], stale
+
+    def set(self, key: Hashable, value: Any):
+        try:
+            with self._transaction() as db:
+                self._store(db, key, value, time.time())
+        except sqlite3.OperationalError as e:
+            logger.warning("Caching %r in %s failed: %s", key, self.path, e)
+
+    def get_or_set(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        def load():
+            value = fn()
+            with self._transaction() as db:
+                now = time.time()
+                row = db.execute(
+                    "SELECT entry FROM cache_entries "
+                    "WHERE namespace = ? AND key = ? AND expires > ?",
+                    (self.namespace, repr(key), now),
+                ).fetchone()
+                # Another process got there first: everybody gets its value
+                if row is not None:
+                    return pickle.loads(row[0])[1]
+                self._store(db, key, value, now)
+            return value
+
+        # Threads of this process compute once; other processes may compute too
+        return self._flights.do(key, load)
+
+    def invalidate(self, key: Hashable):
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, repr(key)),
+            )
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]):
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT key, entry FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchall()
+            db.executemany(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                [
+                    (self.namespace, key)
+                    for key, entry in rows
+                    if predicate(*pickle.loads(entry))
+                ],
+            )
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            )
+
+    def stats(self) -> dict:
+        (size,) = (
+            self._connection()
+            .execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            )
+            .fetchone()
+        )
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class _Call:
+    __slots__ = ("thread", "done", "result", "error")
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run ``fn`` once for concurrent ``do(key, fn)`` calls from several threads.
+
+    Callers arriving while a call for ``key`` is running wait for it and get
+    its result (or exception). A caller on the thread already running the
+    call (another greenlet of AsyncSession.run_sync) computes on its own,
+    since waiting there would block the call it waits for.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            elif call.thread != threading.get_ident():
+                self.shared += 1
+        if not leader:
+            if call.thread == threading.get_ident():
+                return fn()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """Await ``fn()`` once for concurrent ``do(key, fn)`` calls from coroutines.
+
+    If the caller running it is cancelled, one of the waiters takes over.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self.shared += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: try again
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting: don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
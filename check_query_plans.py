@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Check that the hot BlogDatabase queries are served by an index.
+
+Runs each listing/filter query through BlogDatabase, captures the SQL it
+emits and EXPLAINs it against the configured DATABASE_URL. Exits with a
+non-zero status if any statement falls back to a full table scan, or if a
+call fails.
+
+The search_* checks only pass once the full-text migration has run; without
+it searches fall back to ``LIKE '%q%'``, which always scans.
+
+Usage:
+    python check_query_plans.py
+"""
+
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import event
+import database
+from database import Base, db, engine
+
+TABLES = set(Base.metadata.tables)
+
+
+def with_sql_search(call):
+    """``call`` run with search_all_paginated on the SQL backend, whatever
+    SEARCH_BACKEND is configured (the index backend runs no SQL)"""
+
+    def run():
+        backend, database.SEARCH_BACKEND = database.SEARCH_BACKEND, "sql"
+        try:
+            return call()
+        finally:
+            database.SEARCH_BACKEND = backend
+
+    return run
+
+
+# (description, call) for every query shape the indexes are meant to cover
+CHECKS = [
+    ("get_post", lambda: db.get_post(1)),
+    ("get_posts", lambda: db.get_posts(limit=5)),
+    ("get_posts(category)", lambda: db.get_posts(limit=5, category="noticias")),
+    ("get_published_posts_cursor", lambda: db.get_published_posts_cursor()),
+    (
+        "get_published_posts_cursor(summary)",
+        lambda: db.get_published_posts_cursor(with_total=True, summary=True),
+    ),
+    (
+        "get_published_posts_cursor(category)",
+        lambda: db.get_published_posts_cursor(category="noticias"),
+    ),
+    ("get_page_by_slug", lambda: db.get_page_by_slug("inicio")),
+    ("get_pages", lambda: db.get_pages()),
+    ("get_lines(gauge_type)", lambda: db.get_lines(gauge_type="iberico")),
+    ("get_lines(status)", lambda: db.get_lines(status="active")),
+    (
+        "get_lines(gauge_type, status)",
+        lambda: db.get_lines(gauge_type="iberico", status="active"),
+    ),
+    ("get_lines_by_city", lambda: db.get_lines_by_city(1)),
+    ("get_stations(station_type)", lambda: db.get_stations(station_type="principal")),
+    ("get_stations(city_id)", lambda: db.get_stations(city_id=1)),
+    ("get_stations(province)", lambda: db.get_stations(province="madrid")),
+    ("get_stations(name)", lambda: db.get_stations(name="estacion")),
+    ("get_cities(name)", lambda: db.get_cities(name="zaragosa")),
+    ("get_projects(status)", lambda: db.get_projects(status="planning")),
+    ("get_city_by_slug", lambda: db.get_city_by_slug("madrid")),
+    ("get_cities_by_ids", lambda: db.get_cities_by_ids([1, 2, 3])),
+    ("get_categories_by_ids", lambda: db.get_categories_by_ids([1, 2, 3])),
+    ("get_recent_entries", lambda: db.get_recent_entries(limit=5)),
+    ("search_posts", lambda: db.search_posts("estacion")),
+    (
+        "search_all_paginated(sql)",
+        with_sql_search(lambda: db.search_all_paginated("estacion")),
+    ),
+    (
+        "search_all_paginated(sql, facets)",
+        with_sql_search(lambda: db.search_all_paginated("estacion", facets=True)),
+    ),
+]
+
+
+def capture_statements(call):
+    """Run a BlogDatabase call and return the (sql, params) it executed"""
+    statements = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        # Skip catalog lookups such as the full-text availability check
+        if statement.lstrip().upper().startswith("SELECT") and (
+            "sqlite_master" not in statement and "information_schema" not in statement
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def full_scans(statement, parameters):
+    """Return the plan lines of ``statement`` that scan a whole table"""
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            details = [row[-1] for row in rows]
+            # "SCAN posts" is a full scan, "SCAN posts USING INDEX ..." is not.
+            # Scans of subqueries and FTS5 tables aren't table scans either.
+            return [
+                d
+                for d in details
+                if d.startswith("SCAN") and "USING" not in d and d.split()[1] in TABLES
+            ]
+        rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings()
+        return [
+            f"{row['table']}: type=ALL"
+            for row in rows
+            if row.get("type") == "ALL" and row.get("table") in TABLES
+        ]
+
+
+def main():
+    # The in-memory indexes and the cities/categories snapshot read whole
+    # tables once when loaded; that isn't a per-request query, so load them
+    # before capturing anything
+    db.load_indexes()
+    db.load_reference_data()
+    failures = 0
+    for description, call in CHECKS:
+        print(f"{description}")
+        try:
+            statements = capture_statements(call)
+        except Exception as e:
+            # A query that fails has no plan to check: that is a failure too
+            failures += 1
+            print(f"  FAILED: {type(e).__name__}: {e}")
+            continue
+        for statement, parameters in statements:
+            scans = full_scans(statement, parameters)
+            if scans:
+                failures += 1
+                print(f"  FULL SCAN: {'; '.join(scans)}")
+                print(f"    {' '.join(statement.split())}")
+    if failures:
+        print(f"\n{failures} call(s) failed or fall back to a full table scan")
+        sys.exit(1)
+    print("\nAll checked queries use an index")
+
+
+if __name__ == "__main__":
+    main()
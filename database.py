@@ -1,6 +1,19 @@
 import os
-from typing import List, Optional
+import re
+import asyncio
+import html
+import json
+import time
+import base64
+import functools
+import inspect
+import threading
+from collections import Counter
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
 from datetime import datetime
+from types import MappingProxyType
 from sqlalchemy import (
     create_engine,
     Column,
@@ -10,12 +23,31 @@ from sqlalchemy import (
     DateTime,
     Boolean,
     desc,
+    asc,
+    and_,
+    bindparam,
+    case,
+    or_,
     ForeignKey,
+    Index,
+    event,
+    func,
+    literal,
+    literal_column,
+    null,
+    select,
+    table,
+    text,
+    union_all,
 )
+from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from models import (
     Post,
+    PostSummary,
     PostCreate,
     PostUpdate,
     Page,
@@ -39,15 +71,70 @@ from models import (
     Category,
     CategoryCreate,
     CategoryUpdate,
+    PostCategory,
+)
+from cache import AsyncSingleFlight, SingleFlight, TTLCache
+from mappers import compile_mapper, csv_list
+from search_index import (
+    Document,
+    IncrementalIndex,
+    PrefixIndex,
+    SearchIndex,
+    SpellingIndex,
+    TrigramIndex,
+    strip_tags,
 )
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./blog.db")
 
+# Async drivers used for the same database by the request handlers
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+asyncmy",
+    "mysql+pymysql": "mysql+asyncmy",
+    "mysql+mysqldb": "mysql+asyncmy",
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL to the equivalent async driver URL"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL", get_async_database_url(DATABASE_URL)
+)
+
 # Create SQLAlchemy engine
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the FastAPI routes, so queries don't block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autocommit=False, autoflush=False, expire_on_commit=True
+)
+
+# Per-request database usage counters, set by the request session middleware
+db_usage: ContextVar[Optional[dict]] = ContextVar("db_usage", default=None)
+
+
+@event.listens_for(engine, "checkout")
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    usage = db_usage.get()
+    if usage is not None:
+        usage["checkouts"] += 1
+
+
+@event.listens_for(Session, "after_begin")
+def _count_transaction(session, transaction, connection):
+    usage = db_usage.get()
+    if usage is not None:
+        usage["transactions"] += 1
+
 # Create base class for models
 Base = declarative_base()
 
@@ -62,8 +149,22 @@ class PostModel(Base):
     author = Column(String(100), nullable=False)
     is_published = Column(Boolean, default=True)
     category = Column(String(50), nullable=True)  # 'noticias', 'curiosidades', 'eventos'
+    excerpt = Column(String(200), nullable=True)  # plain-text preview, see make_excerpt()
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # NOT NULL: keyset pagination seeks on it, and would skip NULL rows
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_posts_published_updated", "is_published", "updated_at", "id"),
+        Index(
+            "ix_posts_published_category_updated",
+            "is_published",
+            "category",
+            "updated_at",
+            "id",
+        ),
+        Index("ix_posts_published_created", "is_published", "created_at", "id"),
+    )
 
 
 # SQLAlchemy Page model
@@ -78,6 +179,10 @@ class PageModel(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_pages_published_created", "is_published", "created_at"),
+    )
+
 
 # SQLAlchemy Line model
 class LineModel(Base):
@@ -96,6 +201,24 @@ class LineModel(Base):
     # Relationships
     category = relationship("CategoryModel", back_populates="lines")
 
+    __table_args__ = (
+        Index("ix_lines_gauge_type_status", "gauge_type", "status"),
+        Index("ix_lines_status", "status"),
+        Index("ix_lines_updated_at", "updated_at"),
+    )
+
+
+# SQLAlchemy association between lines and the cities they serve
+class LineCityModel(Base):
+    __tablename__ = "line_cities"
+
+    line_id = Column(Integer, ForeignKey("lines.id", ondelete="CASCADE"), primary_key=True)
+    city_id = Column(Integer, ForeignKey("cities.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_line_cities_city_id", "city_id", "line_id"),
+    )
+
 
 # SQLAlchemy Station model
 class StationModel(Base):
@@ -116,6 +239,13 @@ class StationModel(Base):
     # Relationships
     city = relationship("CityModel", back_populates="stations")
 
+    __table_args__ = (
+        Index("ix_stations_station_type", "station_type"),
+        Index("ix_stations_city_id", "city_id"),
+        Index("ix_stations_province", "province"),
+        Index("ix_stations_updated_at", "updated_at"),
+    )
+
 
 # SQLAlchemy Project model
 class ProjectModel(Base):
@@ -137,6 +267,13 @@ class ProjectModel(Base):
     category = relationship("CategoryModel", back_populates="projects")
     city = relationship("CityModel", back_populates="projects")
 
+    __table_args__ = (
+        Index("ix_projects_status", "status"),
+        Index("ix_projects_city_id", "city_id"),
+        Index("ix_projects_category_id", "category_id"),
+        Index("ix_projects_updated_at", "updated_at"),
+    )
+
 
 # SQLAlchemy Event model
 class EventModel(Base):
@@ -174,6 +311,10 @@ class CityModel(Base):
     projects = relationship("ProjectModel", back_populates="city")
     events = relationship("EventModel", back_populates="city")
 
+    __table_args__ = (
+        Index("ix_cities_updated_at", "updated_at"),
+    )
+
 
 # SQLAlchemy Category model
 class CategoryModel(Base):
@@ -197,10 +338,946 @@ class CategoryModel(Base):
     children = relationship("CategoryModel", back_populates="parent")
 
 
+# Materialized "recent entries": one row per listed post, line, station,
+# project and city, kept current by _write_activity_feed on every flush
+class ActivityFeedModel(Base):
+    __tablename__ = "activity_feed"
+
+    entity_type = Column(String(20), primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+    title = Column(String(255), nullable=False)
+    url = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_activity_feed_updated_at", "updated_at"),
+    )
+
+
+# One counter per entity type, bumped by every transaction that writes rows
+# of that type; other processes compare it with what their caches have seen
+class ContentVersionModel(Base):
+    __tablename__ = "content_versions"
+
+    entity_type = Column(String(20), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Which rows each content_versions bump covered, so other processes can
+# update their in-memory indexes row by row; the last
+# CONTENT_CHANGE_LOG_VERSIONS versions of each type are kept
+class ContentChangeModel(Base):
+    __tablename__ = "content_changes"
+
+    entity_type = Column(String(20), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    entity_id = Column(Integer, primary_key=True)
+
+
 # Tables will be created by Alembic migrations
 # Base.metadata.create_all(bind=engine)
 
 
+# Row -> Pydantic mappers, compiled once at import (no per-row validation)
+post_from_row = compile_mapper(
+    Post,
+    PostModel,
+    {
+        "is_published": bool,
+        "category": lambda value: PostCategory(value) if value else None,
+    },
+)
+page_from_row = compile_mapper(Page, PageModel, {"is_published": bool})
+line_from_row = compile_mapper(Line, LineModel, {"cities_served": csv_list})
+station_from_row = compile_mapper(
+    Station, StationModel, {"services": csv_list, "accessibility": csv_list}
+)
+project_from_row = compile_mapper(Project, ProjectModel)
+event_from_row = compile_mapper(Event, EventModel)
+city_from_row = compile_mapper(City, CityModel)
+category_from_row = compile_mapper(
+    Category, CategoryModel, {"description": lambda value: value or None}
+)
+
+
+_post_summary_from_row = compile_mapper(
+    PostSummary,
+    PostModel,
+    {
+        "is_published": bool,
+        "category": lambda value: PostCategory(value) if value else None,
+    },
+)
+
+
+def post_summary_from_row(row) -> PostSummary:
+    """PostSummary for a POST_SUMMARY_COLUMNS row"""
+    summary = _post_summary_from_row(row)
+    if summary.excerpt is None and row.content_head is not None:
+        # Stored without an excerpt (outside the ORM): build one from the head
+        summary.excerpt = make_excerpt(row.content_head)
+    return summary
+
+
+# Columns of PostSummary: listings never load the HTML content, except the
+# start of it for a post whose excerpt is missing
+EXCERPT_SOURCE_LENGTH = 2000
+POST_SUMMARY_COLUMNS = (
+    PostModel.id,
+    PostModel.title,
+    PostModel.author,
+    PostModel.is_published,
+    PostModel.category,
+    PostModel.excerpt,
+    PostModel.created_at,
+    PostModel.updated_at,
+    case(
+        (PostModel.excerpt.is_(None), func.substr(PostModel.content, 1, EXCERPT_SOURCE_LENGTH)),
+        else_=null(),
+    ).label("content_head"),
+)
+
+EXCERPT_LENGTH = 150
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def make_excerpt(content: Optional[str], length: int = EXCERPT_LENGTH) -> str:
+    """Plain-text preview of HTML ``content``, stored in posts.excerpt"""
+    if not content:
+        return ""
+    text = " ".join(html.unescape(_TAG_RE.sub(" ", content)).split())
+    if len(text) > length:
+        text = text[:length].rstrip() + "..."
+    return text
+
+
+@event.listens_for(PostModel.content, "set")
+def _set_excerpt(post, content, oldvalue, initiator):
+    # Every write of the content, through BlogDatabase or not, refreshes it
+    post.excerpt = make_excerpt(content)
+
+
+# Keyset (cursor) pagination helpers
+class CursorPage(NamedTuple):
+    """One page of a keyset-paginated query"""
+
+    items: list
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+    total_count: Optional[int] = None
+
+
+def encode_cursor(sort_value: datetime, row_id: int, direction: str) -> str:
+    """Build an opaque cursor token pointing after/before the given row"""
+    payload = json.dumps([sort_value.isoformat(), row_id, direction])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int, str]:
+    """Decode a cursor token, raising ValueError if it is malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_value, row_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(sort_value), int(row_id), direction
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+
+
+def keyset_paginate(query, sort_column, id_column, cursor: Optional[str], per_page: int):
+    """Fetch one page of ``query`` ordered by (sort_column, id) descending.
+
+    Returns the rows plus next/prev cursor tokens. Instead of OFFSET, the
+    query seeks past the cursor's (sort value, id) pair, so a deep page costs
+    the same as the first one.
+    """
+    direction = "next"
+    if cursor:
+        sort_value, row_id, direction = decode_cursor(cursor)
+        if direction == "next":
+            query = query.filter(
+                or_(
+                    sort_column < sort_value,
+                    and_(sort_column == sort_value, id_column < row_id),
+                )
+            )
+        else:
+            query = query.filter(
+                or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, id_column > row_id),
+                )
+            )
+
+    if direction == "next":
+        order = (desc(sort_column), desc(id_column))
+    else:
+        order = (asc(sort_column), asc(id_column))
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == "prev":
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    sort_key = sort_column.key
+    first, last = rows[0], rows[-1]
+    has_next = has_more if direction == "next" else True
+    has_prev = bool(cursor) if direction == "next" else has_more
+    next_cursor = (
+        encode_cursor(getattr(last, sort_key), last.id, "next") if has_next else None
+    )
+    prev_cursor = (
+        encode_cursor(getattr(first, sort_key), first.id, "prev") if has_prev else None
+    )
+    return rows, next_cursor, prev_cursor
+
+
+# Full-text search. Migration e4b7d1c9a3f6 creates FTS5 tables kept in sync by
+# triggers on SQLite and FULLTEXT indexes on MySQL; other databases, or one
+# without them (e.g. built with create_all), fall back to substring matching.
+FULLTEXT_COLUMNS = {
+    "posts": ("title", "content"),
+    "lines": ("line_number", "description"),
+    "stations": ("name", "station_code", "address"),
+    "projects": ("title", "description"),
+    "cities": ("name", "region"),
+}
+_WORD_RE = re.compile(r"\w+")
+_fulltext_available: Dict[str, bool] = {}
+
+
+def fulltext_available(db: Session) -> bool:
+    """Whether the full-text tables/indexes exist (checked once per database)"""
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _fulltext_available:
+        if bind.dialect.name == "sqlite":
+            found = db.execute(
+                text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'")
+            ).scalar()
+        elif bind.dialect.name == "mysql":
+            found = db.execute(
+                text(
+                    "SELECT count(*) FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() AND table_name = 'posts' "
+                    "AND index_type = 'FULLTEXT'"
+                )
+            ).scalar()
+        else:
+            found = 0
+        _fulltext_available[key] = bool(found)
+    return _fulltext_available[key]
+
+
+def apply_text_search(db: Session, query, model, search: str):
+    """Restrict ``query`` to ``model`` rows matching ``search``.
+
+    Returns ``(query, score)`` where ``score`` is a relevance column (higher is
+    better) or None when falling back to unranked substring matching. Every
+    word of ``search`` must match, as a prefix.
+    """
+    columns = [getattr(model, name) for name in FULLTEXT_COLUMNS[model.__tablename__]]
+    terms = _WORD_RE.findall(search)
+    if not terms or not fulltext_available(db):
+        return query.filter(or_(*[column.contains(search) for column in columns])), None
+
+    if db.get_bind().dialect.name == "sqlite":
+        fts_name = f"{model.__tablename__}_fts"
+        fts = table(fts_name, literal_column("rowid"))
+        matches = (
+            select(
+                fts.c.rowid.label("id"),
+                (-func.bm25(literal_column(fts_name))).label("score"),
+            )
+            .where(literal_column(fts_name).op("MATCH")(" ".join(f'"{term}"*' for term in terms)))
+            .subquery()
+        )
+        return query.join(matches, matches.c.id == model.id), matches.c.score
+
+    score = mysql.match(*columns, against=" ".join(f"+{term}*" for term in terms)).in_boolean_mode()
+    return query.filter(score > 0), score
+
+
+def _by_relevance(score, date_column) -> tuple:
+    """ORDER BY clauses: best score first, then newest"""
+    if score is None:
+        return (desc(date_column),)
+    return (desc(score), desc(date_column))
+
+
+# Change feed. Every flush records which rows were inserted, updated or
+# deleted as (entity_type, id, object) in session.info, with ``object`` the
+# Pydantic model (None once deleted). When the transaction commits the
+# changes go to the on_commit() listeners; a rollback drops them. In-memory
+# indexes and caches stay in step with committed data this way, whether the
+# write came from BlogDatabase or a request's unit of work.
+ENTITY_TYPES = {
+    PostModel: ("post", post_from_row),
+    PageModel: ("page", page_from_row),
+    LineModel: ("line", line_from_row),
+    StationModel: ("station", station_from_row),
+    ProjectModel: ("project", project_from_row),
+    EventModel: ("event", event_from_row),
+    CityModel: ("city", city_from_row),
+    CategoryModel: ("category", category_from_row),
+}
+MODELS_BY_TYPE = {entity_type: model for model, (entity_type, _) in ENTITY_TYPES.items()}
+_commit_listeners: List[Callable[[List[tuple]], None]] = []
+
+
+def on_commit(listener: Callable[[List[tuple]], None]):
+    """Register ``listener(changes)`` to run after each commit that changed rows"""
+    _commit_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    changes = session.info.setdefault("changes", {})
+    for instances, deleted in (
+        (session.new, False),
+        (session.dirty, False),
+        (session.deleted, True),
+    ):
+        for instance in instances:
+            entity = ENTITY_TYPES.get(type(instance))
+            if entity is None:
+                continue
+            entity_type, to_model = entity
+            # The last state in the transaction wins
+            changes[(entity_type, instance.id)] = None if deleted else to_model(instance)
+
+
+def activity_entry(entity_type: str, row) -> Optional[dict]:
+    """The activity_feed values for an ORM row, or None if it isn't listed"""
+    if entity_type == "post":
+        if not row.is_published:
+            return None
+        title, url = row.title, f'/post/{row.id}'
+    elif entity_type == "line":
+        title, url = f'Línea {row.line_number}', f'/lines/{row.id}'
+    elif entity_type == "station":
+        title, url = row.name, f'/stations/{row.id}'
+    elif entity_type == "project":
+        title, url = row.title, f'/projects/{row.id}'
+    elif entity_type == "city":
+        title, url = row.name, f'/cities/{row.slug}' if row.slug else f'/cities/{row.id}'
+    else:
+        return None
+    return {
+        'entity_type': entity_type,
+        'entity_id': row.id,
+        'title': title,
+        'url': url,
+        'updated_at': row.updated_at or row.created_at or datetime.utcnow(),
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _write_activity_feed(session, flush_context):
+    # Same transaction as the write, so the feed can't miss or outlive a row
+    removed, entries = [], []
+    for instances, deleted in (
+        (session.new, False),
+        (session.dirty, False),
+        (session.deleted, True),
+    ):
+        for instance in instances:
+            entity = ENTITY_TYPES.get(type(instance))
+            if entity is None:
+                continue
+            entity_type = entity[0]
+            removed.append({'feed_type': entity_type, 'feed_id': instance.id})
+            entry = None if deleted else activity_entry(entity_type, instance)
+            if entry is not None:
+                entries.append(entry)
+    if not removed:
+        return
+    feed = ActivityFeedModel.__table__
+    connection = session.connection()
+    connection.execute(
+        feed.delete().where(
+            feed.c.entity_type == bindparam('feed_type'), feed.c.entity_id == bindparam('feed_id')
+        ),
+        removed,
+    )
+    if entries:
+        connection.execute(feed.insert(), entries)
+
+
+def fold_name(name: str) -> str:
+    """City name as matched against lines.cities_served. Folded in Python:
+    SQL lower() only folds ASCII on SQLite, so "ÁVILA" wouldn't be "Ávila"."""
+    return name.strip().casefold()
+
+
+def served_names(cities_served: Optional[str]) -> set:
+    return {fold_name(name) for name in (cities_served or "").split(",") if name.strip()}
+
+
+@event.listens_for(Session, "after_flush")
+def _write_line_cities(session, flush_context):
+    # line_cities mirrors lines.cities_served; rebuilt here, in the same
+    # transaction, for every line or city written through any session
+    lines, cities, unlinked = [], [], []
+    for instance in (*session.new, *session.dirty):
+        changed = instance in session.new
+        if isinstance(instance, LineModel):
+            if changed or get_history(instance, 'cities_served').has_changes():
+                lines.append(instance)
+        elif isinstance(instance, CityModel):
+            if changed or get_history(instance, 'name').has_changes():
+                cities.append(instance)
+    for instance in session.deleted:
+        if isinstance(instance, LineModel):
+            unlinked.append({'link_line': instance.id, 'link_city': None})
+        elif isinstance(instance, CityModel):
+            unlinked.append({'link_line': None, 'link_city': instance.id})
+    if not (lines or cities or unlinked):
+        return
+
+    links = LineCityModel.__table__
+    connection = session.connection()
+    unlinked += [{'link_line': line.id, 'link_city': None} for line in lines]
+    unlinked += [{'link_line': None, 'link_city': city.id} for city in cities]
+    connection.execute(
+        links.delete().where(
+            or_(links.c.line_id == bindparam('link_line'), links.c.city_id == bindparam('link_city'))
+        ),
+        unlinked,
+    )
+
+    rows = set()
+    if lines:
+        city_ids = {}
+        for city_id, name in connection.execute(select(CityModel.id, CityModel.name)):
+            city_ids.setdefault(fold_name(name), []).append(city_id)
+        for line in lines:
+            for name in served_names(line.cities_served):
+                rows.update((line.id, city_id) for city_id in city_ids.get(name, ()))
+    if cities:
+        names = {}
+        for city in cities:
+            names.setdefault(fold_name(city.name), []).append(city.id)
+        for line_id, cities_served in connection.execute(
+            select(LineModel.id, LineModel.cities_served).where(LineModel.cities_served != '')
+        ):
+            for name in served_names(cities_served) & names.keys():
+                rows.update((line_id, city_id) for city_id in names[name])
+    if rows:
+        connection.execute(
+            links.insert(), [{'line_id': line_id, 'city_id': city_id} for line_id, city_id in rows]
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop("changes", None)
+    if not changes:
+        return
+    changes = [(entity_type, entity_id, obj) for (entity_type, entity_id), obj in changes.items()]
+    for listener in _commit_listeners:
+        listener(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("changes", None)
+    session.info.pop("bumped_versions", None)
+    session.info.pop("logged_changes", None)
+
+
+# Cross-process invalidation. The change feed above only reaches this
+# process; other workers learn about a write from the content_versions row
+# of its entity type, which the transaction bumps once. Every process keeps
+# the versions its caches reflect in _content_versions; sync_content_versions
+# reads the table (at most every CONTENT_VERSION_CHECK_INTERVAL seconds) and
+# calls the on_remote_change() listeners with the types that moved, which
+# drop those cache namespaces.
+CONTENT_TYPES = tuple(entity_type for entity_type, _ in ENTITY_TYPES.values())
+CONTENT_VERSION_CHECK_INTERVAL = float(os.getenv("CONTENT_VERSION_CHECK_INTERVAL", "1"))
+CONTENT_CHANGE_LOG_VERSIONS = 1000
+_content_versions: Dict[str, int] = {}
+_content_versions_checked = 0.0
+_content_versions_lock = threading.Lock()
+_remote_change_listeners: List[Callable[[set], None]] = []
+
+
+def on_remote_change(listener: Callable[[set], None]):
+    """Register ``listener(entity_types)`` to run when another process changed them"""
+    _remote_change_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(ContentVersionModel.__table__, "after_create")
+def _seed_content_versions(target, connection, **kw):
+    connection.execute(target.insert(), [{'entity_type': t, 'version': 0} for t in CONTENT_TYPES])
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_content_versions(session, flush_context):
+    bumped = session.info.setdefault("bumped_versions", {})
+    logged = session.info.setdefault("logged_changes", set())
+    changed = {
+        (ENTITY_TYPES[type(instance)][0], instance.id)
+        for instances in (session.new, session.dirty, session.deleted)
+        for instance in instances
+        if type(instance) in ENTITY_TYPES
+    } - logged
+    if not changed:
+        return
+    connection = session.connection()
+    entity_types = {entity_type for entity_type, _ in changed} - set(bumped)
+    if entity_types:
+        versions = ContentVersionModel.__table__
+        connection.execute(
+            versions.update()
+            .where(versions.c.entity_type.in_(entity_types))
+            .values(version=versions.c.version + 1, updated_at=datetime.utcnow())
+        )
+        new_versions = connection.execute(
+            select(versions.c.entity_type, versions.c.version).where(
+                versions.c.entity_type.in_(entity_types)
+            )
+        ).all()
+        bumped.update(new_versions)
+        log = ContentChangeModel.__table__
+        connection.execute(
+            log.delete().where(
+                log.c.entity_type == bindparam('log_type'), log.c.version <= bindparam('log_version')
+            ),
+            [
+                {'log_type': entity_type, 'log_version': version - CONTENT_CHANGE_LOG_VERSIONS}
+                for entity_type, version in new_versions
+            ],
+        )
+    connection.execute(
+        ContentChangeModel.__table__.insert(),
+        [
+            {'entity_type': entity_type, 'version': bumped[entity_type], 'entity_id': entity_id}
+            for entity_type, entity_id in changed
+        ],
+    )
+    logged.update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _adopt_own_versions(session):
+    # Our own bump needs no invalidation (the change feed handled it) unless
+    # another process bumped the same type since we last looked
+    global _content_versions_checked
+    session.info.pop("logged_changes", None)
+    bumped = session.info.pop("bumped_versions", None)
+    if not bumped:
+        return
+    with _content_versions_lock:
+        for entity_type, version in bumped.items():
+            if _content_versions.get(entity_type) == version - 1:
+                _content_versions[entity_type] = version
+            else:
+                # Let the next sync_content_versions look, however recent the last
+                _content_versions_checked = 0.0
+
+
+# In-memory indexes (search_index.py). Each is registered with the function
+# building its Document from a Pydantic object (None to leave the object out)
+# and the entity types it covers. BlogDatabase loads them on first use and
+# the commit listener below keeps them current.
+_memory_indexes: Dict[IncrementalIndex, Tuple[Callable, Optional[Tuple[str, ...]]]] = {}
+
+
+def register_index(index, to_document: Callable, entity_types: Optional[Tuple[str, ...]] = None):
+    _memory_indexes[index] = (to_document, entity_types)
+    return index
+
+
+@on_commit
+def _update_indexes(changes: List[tuple]):
+    for index, (to_document, entity_types) in _memory_indexes.items():
+        for entity_type, entity_id, obj in changes:
+            if entity_types is not None and entity_type not in entity_types:
+                continue
+            document = to_document(entity_type, obj) if obj is not None else None
+            if document is None:
+                index.remove((entity_type, entity_id))
+            else:
+                index.add(document)
+
+
+# Read-through caches for reference data that changes a few times a day
+# (cache.py). ``read_through`` caches a BlogDatabase getter by its arguments;
+# the commit listener below drops exactly the entries a committed change
+# affects.
+_read_caches: Dict[str, List[Tuple[str, TTLCache, Optional[str]]]] = {}
+
+
+def register_read_cache(name: str, cache: TTLCache, entity_types: Iterable[str], key_field: Optional[str] = None):
+    """Have commits (and other processes' writes) to ``entity_types`` invalidate ``cache``"""
+    for entity_type in entity_types:
+        _read_caches.setdefault(entity_type, []).append((name, cache, key_field))
+    return cache
+
+
+def call_key(signature: inspect.Signature, args: tuple, kwargs: dict) -> Optional[tuple]:
+    """Hashable key of a BlogDatabase call, without self and session (None if
+    an argument isn't hashable)"""
+    arguments = signature.bind(None, *args, **kwargs)
+    arguments.apply_defaults()
+    key = tuple(value for name, value in arguments.arguments.items() if name not in ("self", "session"))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def single_flight(method):
+    """Let concurrent identical calls of a BlogDatabase read share one run.
+
+    Threads wait for the call in flight (cache.SingleFlight), and
+    AsyncBlogDatabase coalesces coroutines the same way. Calls on a session
+    holding uncommitted changes always run on their own.
+    """
+    flights = SingleFlight()
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def coalesced_method(self, *args, session: Optional[Session] = None, **kwargs):
+        key = call_key(signature, args, kwargs)
+        if key is None or (session is not None and session.info.get("changes")):
+            return method(self, *args, session=session, **kwargs)
+        return flights.do(key, lambda: method(self, *args, session=session, **kwargs))
+
+    coalesced_method.single_flight = True
+    return coalesced_method
+
+
+def reads_indexes(*indexes):
+    """Mark a BlogDatabase method as reading the in-memory ``indexes``.
+
+    AsyncBlogDatabase builds the ones not built yet in a worker thread before
+    running the method, instead of inside it on the event loop.
+    """
+
+    def mark(method):
+        method.indexes = indexes
+        return method
+
+    return mark
+
+
+def read_through(
+    entity_types: Union[str, Tuple[str, ...]],
+    ttl: float,
+    key_field: Optional[str] = None,
+    maxsize: int = 256,
+):
+    """Cache a BlogDatabase getter of ``entity_types`` rows for ``ttl`` seconds.
+
+    ``key_field`` is the attribute of the returned object that the getter's
+    argument matches ("id" or "slug"); None for listings, which any change
+    to one of ``entity_types`` invalidates. Calls on a session holding
+    uncommitted changes go to the database, so they see their own writes.
+    """
+    if isinstance(entity_types, str):
+        entity_types = (entity_types,)
+
+    def decorator(method):
+        cache = register_read_cache(method.__name__, TTLCache(ttl, maxsize), entity_types, key_field)
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def cached_method(self, *args, session: Optional[Session] = None, **kwargs):
+            if session is not None and session.info.get("changes"):
+                return method(self, *args, session=session, **kwargs)
+            key = call_key(signature, args, kwargs)
+            if key is None:
+                return method(self, *args, session=session, **kwargs)
+            value = cache.get_or_set(key, lambda: method(self, *args, session=session, **kwargs))
+            # Cached lists are shared: hand out a copy callers may modify
+            return list(value) if isinstance(value, list) else value
+
+        cached_method.cache = cache
+        cached_method.single_flight = True
+        return cached_method
+
+    return decorator
+
+
+@on_commit
+def _invalidate_read_caches(changes: List[tuple]):
+    for entity_type, entity_id, obj in changes:
+        for _, cache, key_field in _read_caches.get(entity_type, ()):
+            if key_field is None:
+                cache.clear()
+            elif key_field == "id":
+                cache.invalidate((entity_id,))
+            else:
+                # The entry under the old value holds the row, and one under
+                # the new value may hold a cached "not found"
+                new_key = (getattr(obj, key_field),) if obj is not None else None
+                cache.invalidate_where(
+                    lambda key, value: key == new_key
+                    or (value is not None and value.id == entity_id)
+                )
+
+
+# Cached COUNT(*) results for paginated post listings and searches, keyed
+# by query shape; any committed post change clears them
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL", "60"))
+_count_cache = register_read_cache("post_counts", TTLCache(COUNT_CACHE_TTL, maxsize=256), ("post",))
+
+
+def cached_count(key: tuple, query) -> int:
+    """Return the row count of ``query``, reusing a recent result for the same key"""
+    def count() -> int:
+        # Plain COUNT(*) over the filters, not over a subquery of the selected columns
+        return query.order_by(None).with_entities(func.count()).scalar()
+
+    # A session with uncommitted changes must count its own writes
+    if query.session.info.get("changes"):
+        return count()
+    return _count_cache.get_or_set(key, count)
+
+
+def read_cache_stats() -> Dict[str, dict]:
+    """Size and hit/miss counters of every read-through cache, by method"""
+    return {
+        name: cache.stats()
+        for caches in _read_caches.values()
+        for name, cache, _ in caches
+    }
+
+
+# Cities and categories are small and read on most pages, so they are served
+# from an immutable in-memory snapshot. Commits that change them build a new
+# snapshot and swap it in with one assignment; readers keep whichever
+# snapshot they started with.
+REFERENCE_TYPES = ("city", "category")
+
+
+class ReferenceSnapshot(NamedTuple):
+    """Every city and category, in id order and keyed by id, slug and name"""
+
+    cities: Tuple[City, ...]
+    cities_by_id: Mapping[int, City]
+    cities_by_slug: Mapping[str, City]
+    cities_by_name: Mapping[str, City]
+    categories: Tuple[Category, ...]
+    categories_by_id: Mapping[int, Category]
+    categories_by_slug: Mapping[str, Category]
+    categories_by_name: Mapping[str, Category]
+
+    @classmethod
+    def build(cls, cities: Iterable[City], categories: Iterable[Category]) -> "ReferenceSnapshot":
+        """Snapshot of ``cities`` and ``categories``, each in id order"""
+        cities = tuple(sorted(cities, key=lambda city: city.id))
+        categories = tuple(sorted(categories, key=lambda category: category.id))
+
+        def by(objects, attribute):
+            return MappingProxyType({getattr(obj, attribute): obj for obj in objects})
+
+        return cls(
+            cities, by(cities, "id"), by(cities, "slug"), by(cities, "name"),
+            categories, by(categories, "id"), by(categories, "slug"), by(categories, "name"),
+        )
+
+
+_reference_snapshot: Optional[ReferenceSnapshot] = None
+_reference_lock = threading.Lock()
+# Bumped by every reference change; a load that raced one starts over
+_reference_version = 0
+
+
+@on_commit
+def _swap_reference_snapshot(changes: List[tuple]):
+    global _reference_snapshot, _reference_version
+    changes = [change for change in changes if change[0] in REFERENCE_TYPES]
+    if not changes:
+        return
+    with _reference_lock:
+        _reference_version += 1
+        snapshot = _reference_snapshot
+        if snapshot is None:
+            return
+        cities = dict(snapshot.cities_by_id)
+        categories = dict(snapshot.categories_by_id)
+        for entity_type, entity_id, obj in changes:
+            objects = cities if entity_type == "city" else categories
+            if obj is None:
+                objects.pop(entity_id, None)
+            else:
+                objects[entity_id] = obj
+        _reference_snapshot = ReferenceSnapshot.build(cities.values(), categories.values())
+
+
+@on_remote_change
+def _drop_stale_caches(entity_types: set):
+    global _reference_snapshot, _reference_version
+    for entity_type in entity_types:
+        for _, cache, _ in _read_caches.get(entity_type, ()):
+            cache.clear()
+    if entity_types.intersection(REFERENCE_TYPES):
+        with _reference_lock:
+            _reference_version += 1
+            _reference_snapshot = None
+
+
+# Site search, used by search_all_paginated when SEARCH_BACKEND is "index";
+# "sql" uses the full-text queries above instead.
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "index")
+
+# Facets counted over search matches besides "type": the field of each
+# entity type that is faceted (and the key its value has in the result data)
+SEARCH_FACETS = {
+    'post': 'category',
+    'line': 'gauge_type',
+    'station': 'province',
+    'project': 'status',
+}
+FACET_ORDER = ('type', 'category', 'gauge_type', 'province', 'status')
+
+
+def search_document(entity_type: str, obj) -> Optional[Document]:
+    """The search index Document for a Pydantic object, if it is searchable"""
+    key = (entity_type, obj.id)
+    if entity_type == "post":
+        if not obj.is_published:
+            return None
+        data = {'title': obj.title, 'description': obj.excerpt or '', 'url': f'/post/{obj.id}', 'author': obj.author}
+        data['category'] = obj.category.value if obj.category else None
+        body = strip_tags(obj.content)
+    elif entity_type == "line":
+        data = {
+            'title': f'Línea {obj.line_number}',
+            'description': (obj.description or '')[:200],
+            'url': f'/lines/{obj.id}',
+            'gauge_type': obj.gauge_type,
+        }
+        body = " ".join([obj.line_number, obj.description or ''] + obj.cities_served)
+    elif entity_type == "station":
+        data = {
+            'title': obj.name,
+            'description': f'{obj.station_code} - {obj.address[:150]}' if obj.address else obj.station_code,
+            'url': f'/stations/{obj.id}',
+            'province': obj.province,
+        }
+        body = " ".join([obj.station_code, obj.address or '', obj.province or ''])
+    elif entity_type == "project":
+        data = {
+            'title': obj.title,
+            'description': (obj.description or '')[:200],
+            'url': f'/projects/{obj.id}',
+            'status': obj.status,
+        }
+        body = obj.description or ''
+    elif entity_type == "city":
+        data = {
+            'title': obj.name,
+            'description': f'{obj.region}, {obj.country}' if obj.region else obj.country,
+            'url': f'/cities/{obj.slug}' if obj.slug else f'/cities/{obj.id}',
+        }
+        body = " ".join([obj.region or '', obj.country or ''])
+    elif entity_type == "event":
+        data = {
+            'title': obj.title,
+            'description': (obj.description or '')[:200],
+            'url': f'/events/{obj.id}',
+        }
+        body = " ".join([obj.description or '', obj.location or ''])
+    else:
+        return None
+    data.update(type=entity_type, id=obj.id, date=obj.created_at)
+    return Document(key, data['title'], body, data, obj.created_at)
+
+
+SEARCH_TYPES = ("post", "line", "station", "project", "city", "event")
+search_index = register_index(SearchIndex(), search_document, SEARCH_TYPES)
+
+
+def search_facets(document: Document) -> Iterable[Tuple[str, str]]:
+    """The (facet, value) pairs a search Document is counted under"""
+    entity_type = document.data['type']
+    yield 'type', entity_type
+    facet = SEARCH_FACETS.get(entity_type)
+    if facet and document.data.get(facet):
+        yield facet, document.data[facet]
+
+
+def facet_list(counts: Dict[str, Counter]) -> Dict[str, List[Tuple[str, int]]]:
+    """Facet counts as (value, count) lists, most common first, in FACET_ORDER"""
+    return {
+        facet: sorted(counts[facet].items(), key=lambda item: (-item[1], item[0]))
+        for facet in FACET_ORDER
+        if counts.get(facet)
+    }
+
+
+# Autocomplete over station names and codes, city names and line numbers
+
+
+def autocomplete_document(entity_type: str, obj) -> Optional[Document]:
+    """The autocomplete Document for a Pydantic object, if it has one"""
+    if entity_type == "station":
+        label, codes, url = obj.name, obj.station_code, f'/stations/{obj.id}'
+    elif entity_type == "city":
+        label, codes = obj.name, ''
+        url = f'/cities/{obj.slug}' if obj.slug else f'/cities/{obj.id}'
+    elif entity_type == "line":
+        label, codes, url = f'Línea {obj.line_number}', obj.line_number, f'/lines/{obj.id}'
+    else:
+        return None
+    return Document((entity_type, obj.id), label, codes, {'type': entity_type, 'label': label, 'url': url})
+
+
+autocomplete_index = register_index(
+    PrefixIndex(), autocomplete_document, ("station", "city", "line")
+)
+
+
+# Trigram indexes behind the name filters of get_cities and get_stations
+def attribute_document(attribute: str) -> Callable:
+    """to_document indexing one attribute of the object as the title"""
+
+    def to_document(entity_type: str, obj) -> Optional[Document]:
+        value = getattr(obj, attribute)
+        return Document((entity_type, obj.id), value, '', {}) if value else None
+
+    return to_document
+
+
+city_name_index = register_index(TrigramIndex(), attribute_document("name"), ("city",))
+station_name_index = register_index(TrigramIndex(), attribute_document("name"), ("station",))
+station_province_index = register_index(
+    TrigramIndex(), attribute_document("province"), ("station",)
+)
+
+
+# "Did you mean" dictionary over post, project and event titles and
+# station and city names
+def spelling_document(entity_type: str, obj) -> Optional[Document]:
+    """The spelling Document for a Pydantic object, if it has one"""
+    if entity_type == "post" and not obj.is_published:
+        return None
+    if entity_type in ("post", "project", "event"):
+        text = obj.title
+    elif entity_type in ("station", "city"):
+        text = obj.name
+    else:
+        return None
+    return Document((entity_type, obj.id), text, '', {}) if text else None
+
+
+spelling_index = register_index(
+    SpellingIndex(), spelling_document, ("post", "project", "event", "station", "city")
+)
+
+
 class BlogDatabase:
     def __init__(self):
         pass
@@ -212,9 +1289,27 @@ class BlogDatabase:
         finally:
             pass
 
-    def create_post(self, post_data: PostCreate) -> Post:
+    @contextmanager
+    def session_scope(self, session: Optional[Session] = None):
+        """Use the given session, or open (and close) a new one for this call"""
+        if session is not None:
+            yield session
+            return
         db = self.get_db()
         try:
+            yield db
+        finally:
+            db.close()
+
+    def _commit(self, db: Session):
+        """Commit, unless the session belongs to a request-wide unit of work"""
+        if db.info.get("unit_of_work"):
+            db.flush()
+        else:
+            db.commit()
+
+    def create_post(self, post_data: PostCreate, session: Optional[Session] = None) -> Post:
+        with self.session_scope(session) as db:
             # Convert PostCategory enum to string for database
             category_str = post_data.category.value if post_data.category else None
             
@@ -226,52 +1321,23 @@ class BlogDatabase:
                 category=category_str,
             )
             db.add(db_post)
-            db.commit()
+            self._commit(db)
             db.refresh(db_post)
 
             # Convert SQLAlchemy model to Pydantic model
-            from models import PostCategory
-            category_enum = PostCategory(db_post.category) if db_post.category else None
             
-            return Post(
-                id=int(db_post.id),
-                title=str(db_post.title),
-                content=str(db_post.content),
-                author=str(db_post.author),
-                is_published=bool(db_post.is_published),
-                category=category_enum,
-                created_at=db_post.created_at,
-                updated_at=db_post.updated_at,
-            )
-        finally:
-            db.close()
+            return post_from_row(db_post)
 
-    def get_post(self, post_id: int) -> Optional[Post]:
-        db = self.get_db()
-        try:
-            from models import PostCategory
+    def get_post(self, post_id: int, session: Optional[Session] = None) -> Optional[Post]:
+        with self.session_scope(session) as db:
             db_post = db.query(PostModel).filter(PostModel.id == post_id).first()
             if db_post:
-                category_enum = PostCategory(db_post.category) if db_post.category else None
-                return Post(
-                    id=int(db_post.id),
-                    title=str(db_post.title),
-                    content=str(db_post.content),
-                    author=str(db_post.author),
-                    is_published=bool(db_post.is_published),
-                    category=category_enum,
-                    created_at=db_post.created_at,
-                    updated_at=db_post.updated_at,
-                )
+                return post_from_row(db_post)
             return None
-        finally:
-            db.close()
 
-    def get_published_posts_paginated(self, page: int = 1, per_page: int = 5, category: Optional[str] = None):
+    def get_published_posts_paginated(self, page: int = 1, per_page: int = 5, category: Optional[str] = None, session: Optional[Session] = None):
         """Get paginated published posts with total count, optionally filtered by category"""
-        db = self.get_db()
-        try:
-            from models import PostCategory
+        with self.session_scope(session) as db:
             # Build query
             query = db.query(PostModel).filter(PostModel.is_published == True)
             if category:
@@ -293,35 +1359,66 @@ class BlogDatabase:
                 .all()
             )
 
-            post_list = [
-                Post(
-                    id=int(post.id),
-                    title=str(post.title),
-                    content=str(post.content),
-                    author=str(post.author),
-                    is_published=bool(post.is_published),
-                    category=PostCategory(post.category) if post.category else None,
-                    created_at=post.created_at,
-                    updated_at=post.updated_at,
-                )
-                for post in posts
-            ]
+            post_list = [post_from_row(post) for post in posts]
 
             return post_list, total_pages
-        finally:
-            db.close()
 
+    @single_flight
+    def get_published_posts_cursor(
+        self,
+        cursor: Optional[str] = None,
+        per_page: int = 5,
+        category: Optional[str] = None,
+        with_total: bool = False,
+        summary: bool = False,
+        session: Optional[Session] = None,
+    ) -> CursorPage:
+        """Get a page of published posts using keyset pagination on (updated_at, id).
+
+        ``cursor`` is a token from a previous page's next/prev cursor. The total
+        count is only computed when ``with_total`` is set, and is cached. With
+        ``summary`` the items are PostSummary objects (excerpt, no content).
+        """
+        with self.session_scope(session) as db:
+            columns = POST_SUMMARY_COLUMNS if summary else (PostModel,)
+            query = db.query(*columns).filter(PostModel.is_published == True)
+            category_str = None
+            if category:
+                category_str = category.value if hasattr(category, 'value') else category.lower()
+                query = query.filter(PostModel.category == category_str)
+
+            posts, next_cursor, prev_cursor = keyset_paginate(
+                query, PostModel.updated_at, PostModel.id, cursor, per_page
+            )
+            total_count = (
+                cached_count(("published_posts", category_str), query)
+                if with_total
+                else None
+            )
+
+            to_post = post_summary_from_row if summary else post_from_row
+            post_list = [to_post(post) for post in posts]
+
+            return CursorPage(post_list, next_cursor, prev_cursor, total_count)
+
+    @single_flight
     def get_posts(
         self,
         skip: int = 0,
         limit: int = 100,
         published_only: bool = True,
         category: Optional[str] = None,
-    ) -> List[Post]:
-        db = self.get_db()
-        try:
-            from models import PostCategory
-            query = db.query(PostModel)
+        summary: bool = False,
+        session: Optional[Session] = None,
+    ) -> List[Union[Post, PostSummary]]:
+        """Get posts, most recently updated first.
+
+        With ``summary`` PostSummary objects are returned and the full
+        ``content`` is not loaded.
+        """
+        with self.session_scope(session) as db:
+            columns = POST_SUMMARY_COLUMNS if summary else (PostModel,)
+            query = db.query(*columns)
             if published_only:
                 query = query.filter(PostModel.is_published == True)
             if category:
@@ -335,26 +1432,11 @@ class BlogDatabase:
                 .all()
             )
 
-            return [
-                Post(
-                    id=int(post.id),
-                    title=str(post.title),
-                    content=str(post.content),
-                    author=str(post.author),
-                    is_published=bool(post.is_published),
-                    category=PostCategory(post.category) if post.category else None,
-                    created_at=post.created_at,
-                    updated_at=post.updated_at,
-                )
-                for post in posts
-            ]
-        finally:
-            db.close()
+            to_post = post_summary_from_row if summary else post_from_row
+            return [to_post(post) for post in posts]
 
-    def update_post(self, post_id: int, post_data: PostUpdate) -> Optional[Post]:
-        db = self.get_db()
-        try:
-            from models import PostCategory
+    def update_post(self, post_id: int, post_data: PostUpdate, session: Optional[Session] = None) -> Optional[Post]:
+        with self.session_scope(session) as db:
             db_post = db.query(PostModel).filter(PostModel.id == post_id).first()
             if db_post:
                 update_data = post_data.dict(exclude_unset=True)
@@ -366,70 +1448,38 @@ class BlogDatabase:
                         setattr(db_post, field, value)
                 # Update timestamp manually
                 db_post.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_post)
-
-                category_enum = PostCategory(db_post.category) if db_post.category else None
-                return Post(
-                    id=int(db_post.id),
-                    title=str(db_post.title),
-                    content=str(db_post.content),
-                    author=str(db_post.author),
-                    is_published=bool(db_post.is_published),
-                    category=category_enum,
-                    created_at=db_post.created_at,
-                    updated_at=db_post.updated_at,
-                )
+                return post_from_row(db_post)
             return None
-        finally:
-            db.close()
 
-    def delete_post(self, post_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_post(self, post_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_post = db.query(PostModel).filter(PostModel.id == post_id).first()
             if db_post:
                 db.delete(db_post)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
-    def search_posts(self, query: str, skip: int = 0, limit: int = 100) -> List[Post]:
-        db = self.get_db()
-        try:
+    def search_posts(self, query: str, skip: int = 0, limit: int = 100, session: Optional[Session] = None) -> List[Post]:
+        """Search published posts, best matches first"""
+        with self.session_scope(session) as db:
+            search_query, score = apply_text_search(
+                db, db.query(PostModel).filter(PostModel.is_published == True), PostModel, query
+            )
             posts = (
-                db.query(PostModel)
-                .filter(
-                    PostModel.is_published == True,
-                    PostModel.title.contains(query) | PostModel.content.contains(query),
-                )
-                .order_by(desc(PostModel.created_at))
+                search_query.order_by(*_by_relevance(score, PostModel.created_at))
                 .offset(skip)
                 .limit(limit)
                 .all()
             )
 
-            return [
-                Post(
-                    id=int(post.id),
-                    title=str(post.title),
-                    content=str(post.content),
-                    author=str(post.author),
-                    is_published=bool(post.is_published),
-                    created_at=post.created_at,
-                    updated_at=post.updated_at,
-                )
-                for post in posts
-            ]
-        finally:
-            db.close()
+            return [post_from_row(post) for post in posts]
 
     # Page methods
-    def create_page(self, page_data: PageCreate) -> Page:
-        db = self.get_db()
-        try:
+    def create_page(self, page_data: PageCreate, session: Optional[Session] = None) -> Page:
+        with self.session_scope(session) as db:
             db_page = PageModel(
                 title=page_data.title,
                 slug=page_data.slug,
@@ -437,65 +1487,34 @@ class BlogDatabase:
                 is_published=page_data.is_published,
             )
             db.add(db_page)
-            db.commit()
+            self._commit(db)
             db.refresh(db_page)
 
-            return Page(
-                id=int(db_page.id),
-                title=str(db_page.title),
-                slug=str(db_page.slug),
-                content=str(db_page.content),
-                is_published=bool(db_page.is_published),
-                created_at=db_page.created_at,
-                updated_at=db_page.updated_at,
-            )
-        finally:
-            db.close()
+            return page_from_row(db_page)
 
-    def get_page(self, page_id: int) -> Optional[Page]:
-        db = self.get_db()
-        try:
+    def get_page(self, page_id: int, session: Optional[Session] = None) -> Optional[Page]:
+        with self.session_scope(session) as db:
             db_page = db.query(PageModel).filter(PageModel.id == page_id).first()
             if db_page:
-                return Page(
-                    id=int(db_page.id),
-                    title=str(db_page.title),
-                    slug=str(db_page.slug),
-                    content=str(db_page.content),
-                    is_published=bool(db_page.is_published),
-                    created_at=db_page.created_at,
-                    updated_at=db_page.updated_at,
-                )
+                return page_from_row(db_page)
             return None
-        finally:
-            db.close()
 
-    def get_page_by_slug(self, slug: str) -> Optional[Page]:
-        db = self.get_db()
-        try:
+    @read_through("page", ttl=300, key_field="slug")
+    def get_page_by_slug(self, slug: str, session: Optional[Session] = None) -> Optional[Page]:
+        with self.session_scope(session) as db:
             db_page = db.query(PageModel).filter(PageModel.slug == slug).first()
             if db_page:
-                return Page(
-                    id=int(db_page.id),
-                    title=str(db_page.title),
-                    slug=str(db_page.slug),
-                    content=str(db_page.content),
-                    is_published=bool(db_page.is_published),
-                    created_at=db_page.created_at,
-                    updated_at=db_page.updated_at,
-                )
+                return page_from_row(db_page)
             return None
-        finally:
-            db.close()
 
     def get_pages(
         self,
         skip: int = 0,
         limit: int = 100,
         published_only: bool = True,
+        session: Optional[Session] = None,
     ) -> List[Page]:
-        db = self.get_db()
-        try:
+        with self.session_scope(session) as db:
             query = db.query(PageModel)
             if published_only:
                 query = query.filter(PageModel.is_published == True)
@@ -506,24 +1525,10 @@ class BlogDatabase:
                 .all()
             )
 
-            return [
-                Page(
-                    id=int(page.id),
-                    title=str(page.title),
-                    slug=str(page.slug),
-                    content=str(page.content),
-                    is_published=bool(page.is_published),
-                    created_at=page.created_at,
-                    updated_at=page.updated_at,
-                )
-                for page in pages
-            ]
-        finally:
-            db.close()
+            return [page_from_row(page) for page in pages]
 
-    def update_page(self, page_id: int, page_data: PageUpdate) -> Optional[Page]:
-        db = self.get_db()
-        try:
+    def update_page(self, page_id: int, page_data: PageUpdate, session: Optional[Session] = None) -> Optional[Page]:
+        with self.session_scope(session) as db:
             db_page = db.query(PageModel).filter(PageModel.id == page_id).first()
             if db_page:
                 update_data = page_data.dict(exclude_unset=True)
@@ -531,90 +1536,64 @@ class BlogDatabase:
                     setattr(db_page, field, value)
                 # Update timestamp manually
                 db_page.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_page)
 
-                return Page(
-                    id=int(db_page.id),
-                    title=str(db_page.title),
-                    slug=str(db_page.slug),
-                    content=str(db_page.content),
-                    is_published=bool(db_page.is_published),
-                    created_at=db_page.created_at,
-                    updated_at=db_page.updated_at,
-                )
+                return page_from_row(db_page)
             return None
-        finally:
-            db.close()
 
-    def delete_page(self, page_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_page(self, page_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_page = db.query(PageModel).filter(PageModel.id == page_id).first()
             if db_page:
                 db.delete(db_page)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # Railway methods - Lines
+    @single_flight
     def get_lines(self, skip: int = 0, limit: int = 100, 
                   gauge_type: Optional[str] = None, 
-                  status: Optional[str] = None) -> List[Line]:
-        db = self.get_db()
-        try:
+                  status: Optional[str] = None, session: Optional[Session] = None) -> List[Line]:
+        with self.session_scope(session) as db:
             query = db.query(LineModel)
             if gauge_type:
                 query = query.filter(LineModel.gauge_type == gauge_type)
             if status:
                 query = query.filter(LineModel.status == status)
             lines = query.offset(skip).limit(limit).all()
-            return [
-                Line(
-                    id=int(line.id),
-                    line_number=str(line.line_number),
-                    description=str(line.description),
-                    status=str(line.status),
-                    gauge_type=str(line.gauge_type) if line.gauge_type else None,
-                    cities_served=line.cities_served.split(",")
-                    if line.cities_served
-                    else [],
-                    category_id=line.category_id,
-                    created_at=line.created_at,
-                    updated_at=line.updated_at,
-                )
-                for line in lines
-            ]
-        finally:
-            db.close()
+            return [line_from_row(line) for line in lines]
 
-    def get_line(self, line_id: int) -> Optional[Line]:
-        db = self.get_db()
-        try:
+    def get_line(self, line_id: int, session: Optional[Session] = None) -> Optional[Line]:
+        with self.session_scope(session) as db:
             line = db.query(LineModel).filter(LineModel.id == line_id).first()
             if line:
-                return Line(
-                    id=int(line.id),
-                    line_number=str(line.line_number),
-                    description=str(line.description),
-                    status=str(line.status),
-                    gauge_type=str(line.gauge_type) if line.gauge_type else None,
-                    cities_served=line.cities_served.split(",")
-                    if line.cities_served
-                    else [],
-                    category_id=line.category_id,
-                    created_at=line.created_at,
-                    updated_at=line.updated_at,
-                )
+                return line_from_row(line)
             return None
-        finally:
-            db.close()
 
-    def create_line(self, line_data: LineCreate) -> Line:
-        db = self.get_db()
-        try:
+    def get_lines_by_city(
+        self,
+        city_id: int,
+        skip: int = 0,
+        limit: int = 100,
+        session: Optional[Session] = None,
+    ) -> List[Line]:
+        """Get the lines serving a city, via the indexed line_cities table"""
+        with self.session_scope(session) as db:
+            lines = (
+                db.query(LineModel)
+                .join(LineCityModel, LineCityModel.line_id == LineModel.id)
+                .filter(LineCityModel.city_id == city_id)
+                .order_by(LineModel.line_number)
+                .offset(skip)
+                .limit(limit)
+                .all()
+            )
+            return [line_from_row(line) for line in lines]
+
+    def create_line(self, line_data: LineCreate, session: Optional[Session] = None) -> Line:
+        with self.session_scope(session) as db:
             db_line = LineModel(
                 line_number=line_data.line_number,
                 description=line_data.description,
@@ -626,28 +1605,13 @@ class BlogDatabase:
                 category_id=line_data.category_id,
             )
             db.add(db_line)
-            db.commit()
+            self._commit(db)
             db.refresh(db_line)
 
-            return Line(
-                id=int(db_line.id),
-                line_number=str(db_line.line_number),
-                description=str(db_line.description),
-                status=str(db_line.status),
-                gauge_type=str(db_line.gauge_type) if db_line.gauge_type else None,
-                cities_served=db_line.cities_served.split(",")
-                if db_line.cities_served
-                else [],
-                category_id=db_line.category_id,
-                created_at=db_line.created_at,
-                updated_at=db_line.updated_at,
-            )
-        finally:
-            db.close()
+            return line_from_row(db_line)
 
-    def update_line(self, line_id: int, line_data: LineUpdate) -> Optional[Line]:
-        db = self.get_db()
-        try:
+    def update_line(self, line_id: int, line_data: LineUpdate, session: Optional[Session] = None) -> Optional[Line]:
+        with self.session_scope(session) as db:
             db_line = db.query(LineModel).filter(LineModel.id == line_id).first()
             if db_line:
                 if line_data.line_number is not None:
@@ -669,155 +1633,101 @@ class BlogDatabase:
                     db_line.category_id = line_data.category_id
 
                 db_line.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_line)
 
-                return Line(
-                    id=int(db_line.id),
-                    line_number=str(db_line.line_number),
-                    description=str(db_line.description),
-                    status=str(db_line.status),
-                    gauge_type=str(db_line.gauge_type) if db_line.gauge_type else None,
-                    cities_served=db_line.cities_served.split(",")
-                    if db_line.cities_served
-                    else [],
-                    category_id=db_line.category_id,
-                    created_at=db_line.created_at,
-                    updated_at=db_line.updated_at,
-                )
+                return line_from_row(db_line)
             return None
-        finally:
-            db.close()
 
-    def delete_line(self, line_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_line(self, line_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_line = db.query(LineModel).filter(LineModel.id == line_id).first()
             if db_line:
                 db.delete(db_line)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # Railway methods - Stations
+    @reads_indexes(station_province_index, station_name_index)
+    @single_flight
     def get_stations(self, skip: int = 0, limit: int = 100,
                      station_type: Optional[str] = None,
                      city_id: Optional[int] = None,
-                     province: Optional[str] = None) -> List[Station]:
-        db = self.get_db()
-        try:
+                     province: Optional[str] = None,
+                     name: Optional[str] = None, session: Optional[Session] = None) -> List[Station]:
+        """Get stations, optionally filtered.
+
+        ``province`` and ``name`` match ignoring case and accents, as a
+        substring or, when nothing contains them, as the closest spellings
+        ("Zaragosa"). They are resolved in memory by trigram indexes into
+        exact province values and station ids for the query; a one-letter
+        one matches nothing. With ``name`` the best matches come first, and
+        only the ids of the requested page are loaded.
+        """
+        with self.session_scope(session) as db:
             query = db.query(StationModel)
             if station_type:
                 query = query.filter(StationModel.station_type == station_type)
             if city_id:
                 query = query.filter(StationModel.city_id == city_id)
             if province:
-                query = query.filter(StationModel.province.ilike(f"%{province}%"))
+                matches = self._built_index(db, station_province_index).match(province)
+                provinces = set().union(*(entry.values() for _, entry in matches))
+                if not provinces:
+                    return []
+                query = query.filter(StationModel.province.in_(provinces))
+            if name:
+                matches = self._built_index(db, station_name_index).match(name)
+                ranked = [station_id for _, entry in matches for _, station_id in entry]
+                if not ranked:
+                    return []
+                rank = {station_id: position for position, station_id in enumerate(ranked)}
+                # Load the best skip + limit ids; the other filters may drop
+                # some, so keep going down the ranking until the page is full
+                wanted = skip + limit
+                batch_size = max(wanted, 1)
+                stations = []
+                for start in range(0, len(ranked), batch_size):
+                    if len(stations) >= wanted:
+                        break
+                    batch = query.filter(StationModel.id.in_(ranked[start:start + batch_size])).all()
+                    stations.extend(sorted(batch, key=lambda station: rank[station.id]))
+                return [station_from_row(station) for station in stations[skip:wanted]]
             stations = query.offset(skip).limit(limit).all()
-            return [
-                Station(
-                    id=int(station.id),
-                    station_code=str(station.station_code),
-                    name=str(station.name),
-                    address=str(station.address),
-                    services=station.services.split(",") if station.services else [],
-                    accessibility=station.accessibility.split(",")
-                    if station.accessibility
-                    else [],
-                    station_type=str(station.station_type) if station.station_type else None,
-                    province=str(station.province) if station.province else None,
-                    city_id=station.city_id,
-                    created_at=station.created_at,
-                    updated_at=station.updated_at,
-                )
-                for station in stations
-            ]
-        finally:
-            db.close()
+            return [station_from_row(station) for station in stations]
 
-    def get_station(self, station_id: int) -> Optional[Station]:
-        db = self.get_db()
-        try:
+    def get_station(self, station_id: int, session: Optional[Session] = None) -> Optional[Station]:
+        with self.session_scope(session) as db:
             station = (
                 db.query(StationModel).filter(StationModel.id == station_id).first()
             )
             if station:
-                return Station(
-                    id=int(station.id),
-                    station_code=str(station.station_code),
-                    name=str(station.name),
-                    address=str(station.address),
-                    services=station.services.split(",") if station.services else [],
-                    accessibility=station.accessibility.split(",")
-                    if station.accessibility
-                    else [],
-                    station_type=str(station.station_type) if station.station_type else None,
-                    province=str(station.province) if station.province else None,
-                    city_id=station.city_id,
-                    created_at=station.created_at,
-                    updated_at=station.updated_at,
-                )
+                return station_from_row(station)
             return None
-        finally:
-            db.close()
 
     # Railway methods - Projects
+    @single_flight
     def get_projects(self, skip: int = 0, limit: int = 100, 
-                     status: Optional[str] = None) -> List[Project]:
-        db = self.get_db()
-        try:
+                     status: Optional[str] = None, session: Optional[Session] = None) -> List[Project]:
+        with self.session_scope(session) as db:
             query = db.query(ProjectModel)
             if status:
                 query = query.filter(ProjectModel.status == status)
             projects = query.offset(skip).limit(limit).all()
-            return [
-                Project(
-                    id=int(project.id),
-                    title=str(project.title),
-                    description=str(project.description),
-                    project_type=str(project.project_type),
-                    budget=project.budget,
-                    timeline=str(project.timeline),
-                    status=str(project.status),
-                    category_id=project.category_id,
-                    city_id=project.city_id,
-                    created_at=project.created_at,
-                    updated_at=project.updated_at,
-                )
-                for project in projects
-            ]
-        finally:
-            db.close()
+            return [project_from_row(project) for project in projects]
 
-    def get_project(self, project_id: int) -> Optional[Project]:
-        db = self.get_db()
-        try:
+    def get_project(self, project_id: int, session: Optional[Session] = None) -> Optional[Project]:
+        with self.session_scope(session) as db:
             project = (
                 db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
             )
             if project:
-                return Project(
-                    id=int(project.id),
-                    title=str(project.title),
-                    description=str(project.description),
-                    project_type=str(project.project_type),
-                    budget=project.budget,
-                    timeline=str(project.timeline),
-                    status=str(project.status),
-                    category_id=project.category_id,
-                    city_id=project.city_id,
-                    created_at=project.created_at,
-                    updated_at=project.updated_at,
-                )
+                return project_from_row(project)
             return None
-        finally:
-            db.close()
 
-    def create_project(self, project_data: ProjectCreate) -> Project:
-        db = self.get_db()
-        try:
+    def create_project(self, project_data: ProjectCreate, session: Optional[Session] = None) -> Project:
+        with self.session_scope(session) as db:
             db_project = ProjectModel(
                 title=project_data.title,
                 description=project_data.description,
@@ -829,30 +1739,15 @@ class BlogDatabase:
                 city_id=project_data.city_id,
             )
             db.add(db_project)
-            db.commit()
+            self._commit(db)
             db.refresh(db_project)
 
-            return Project(
-                id=int(db_project.id),
-                title=str(db_project.title),
-                description=str(db_project.description),
-                project_type=str(db_project.project_type),
-                budget=db_project.budget,
-                timeline=str(db_project.timeline),
-                status=str(db_project.status),
-                category_id=db_project.category_id,
-                city_id=db_project.city_id,
-                created_at=db_project.created_at,
-                updated_at=db_project.updated_at,
-            )
-        finally:
-            db.close()
+            return project_from_row(db_project)
 
     def update_project(
-        self, project_id: int, project_data: ProjectUpdate
+        self, project_id: int, project_data: ProjectUpdate, session: Optional[Session] = None
     ) -> Optional[Project]:
-        db = self.get_db()
-        try:
+        with self.session_scope(session) as db:
             db_project = (
                 db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
             )
@@ -875,214 +1770,151 @@ class BlogDatabase:
                     db_project.city_id = project_data.city_id
 
                 db_project.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_project)
 
-                return Project(
-                    id=int(db_project.id),
-                    title=str(db_project.title),
-                    description=str(db_project.description),
-                    project_type=str(db_project.project_type),
-                    budget=db_project.budget,
-                    timeline=str(db_project.timeline),
-                    status=str(db_project.status),
-                    category_id=db_project.category_id,
-                    city_id=db_project.city_id,
-                    created_at=db_project.created_at,
-                    updated_at=db_project.updated_at,
-                )
+                return project_from_row(db_project)
             return None
-        finally:
-            db.close()
 
-    def delete_project(self, project_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_project(self, project_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_project = (
                 db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
             )
             if db_project:
                 db.delete(db_project)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # Railway methods - Events
-    def get_events(self, skip: int = 0, limit: int = 100) -> List[Event]:
-        db = self.get_db()
-        try:
+    def get_events(self, skip: int = 0, limit: int = 100, session: Optional[Session] = None) -> List[Event]:
+        with self.session_scope(session) as db:
             events = db.query(EventModel).offset(skip).limit(limit).all()
-            return [
-                Event(
-                    id=int(event.id),
-                    title=str(event.title),
-                    description=str(event.description),
-                    event_date=event.event_date,
-                    event_time=str(event.event_time),
-                    location=str(event.location),
-                    event_type=str(event.event_type),
-                    city_id=event.city_id,
-                    created_at=event.created_at,
-                    updated_at=event.updated_at,
-                )
-                for event in events
-            ]
-        finally:
-            db.close()
+            return [event_from_row(event) for event in events]
 
-    def get_event(self, event_id: int) -> Optional[Event]:
-        db = self.get_db()
-        try:
+    def get_event(self, event_id: int, session: Optional[Session] = None) -> Optional[Event]:
+        with self.session_scope(session) as db:
             event = db.query(EventModel).filter(EventModel.id == event_id).first()
             if event:
-                return Event(
-                    id=int(event.id),
-                    title=str(event.title),
-                    description=str(event.description),
-                    event_date=event.event_date,
-                    event_time=str(event.event_time),
-                    location=str(event.location),
-                    event_type=str(event.event_type),
-                    city_id=event.city_id,
-                    created_at=event.created_at,
-                    updated_at=event.updated_at,
-                )
+                return event_from_row(event)
             return None
-        finally:
-            db.close()
 
     # Railway methods - Cities
+    @reads_indexes(city_name_index)
     def get_cities(self, skip: int = 0, limit: int = 100, 
-                   name: Optional[str] = None) -> List[City]:
-        db = self.get_db()
-        try:
+                   name: Optional[str] = None, session: Optional[Session] = None) -> List[City]:
+        """Get cities. ``name`` matches like get_stations(name=...), best first."""
+        snapshot = self._reference_data(session)
+        if snapshot is not None and not name:
+            return list(snapshot.cities[skip:skip + limit])
+        with self.session_scope(session) as db:
             query = db.query(CityModel)
             if name:
-                query = query.filter(CityModel.name.ilike(f"%{name}%"))
+                matches = self._built_index(db, city_name_index).match(name)
+                ranked = [city_id for _, entry in matches for _, city_id in entry][skip:skip + limit]
+                if snapshot is not None:
+                    cities = snapshot.cities_by_id
+                else:
+                    cities = {
+                        city.id: city_from_row(city) for city in query.filter(CityModel.id.in_(ranked))
+                    }
+                return [cities[city_id] for city_id in ranked if city_id in cities]
             cities = query.offset(skip).limit(limit).all()
-            return [
-                City(
-                    id=int(city.id),
-                    name=str(city.name),
-                    slug=str(city.slug),
-                    region=str(city.region),
-                    country=str(city.country),
-                    created_at=city.created_at,
-                    updated_at=city.updated_at,
-                )
-                for city in cities
-            ]
-        finally:
-            db.close()
+            return [city_from_row(city) for city in cities]
 
-    def get_city(self, city_id: int) -> Optional[City]:
-        db = self.get_db()
-        try:
+    def get_city(self, city_id: int, session: Optional[Session] = None) -> Optional[City]:
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return snapshot.cities_by_id.get(city_id)
+        with self.session_scope(session) as db:
             city = db.query(CityModel).filter(CityModel.id == city_id).first()
             if city:
-                return City(
-                    id=int(city.id),
-                    name=str(city.name),
-                    slug=str(city.slug),
-                    region=str(city.region),
-                    country=str(city.country),
-                    created_at=city.created_at,
-                    updated_at=city.updated_at,
-                )
+                return city_from_row(city)
             return None
-        finally:
-            db.close()
 
-    def get_city_by_slug(self, slug: str) -> Optional[City]:
-        db = self.get_db()
-        try:
+    def get_city_by_slug(self, slug: str, session: Optional[Session] = None) -> Optional[City]:
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return snapshot.cities_by_slug.get(slug)
+        with self.session_scope(session) as db:
             city = db.query(CityModel).filter(CityModel.slug == slug).first()
             if city:
-                return City(
-                    id=int(city.id),
-                    name=str(city.name),
-                    slug=str(city.slug),
-                    region=str(city.region),
-                    country=str(city.country),
-                    created_at=city.created_at,
-                    updated_at=city.updated_at,
-                )
+                return city_from_row(city)
             return None
-        finally:
-            db.close()
+
+    def get_cities_by_ids(
+        self, city_ids: Iterable[int], session: Optional[Session] = None
+    ) -> Dict[int, City]:
+        """Get several cities in one query, keyed by id"""
+        ids = {city_id for city_id in city_ids if city_id}
+        if not ids:
+            return {}
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return {city_id: snapshot.cities_by_id[city_id] for city_id in ids if city_id in snapshot.cities_by_id}
+        with self.session_scope(session) as db:
+            cities = db.query(CityModel).filter(CityModel.id.in_(ids)).all()
+            return {city.id: city_from_row(city) for city in cities}
 
     # Railway methods - Categories
-    def get_categories(self, skip: int = 0, limit: int = 100) -> List[Category]:
-        db = self.get_db()
-        try:
+    def get_categories(self, skip: int = 0, limit: int = 100, session: Optional[Session] = None) -> List[Category]:
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return list(snapshot.categories[skip:skip + limit])
+        with self.session_scope(session) as db:
             categories = db.query(CategoryModel).offset(skip).limit(limit).all()
-            return [
-                Category(
-                    id=int(category.id),
-                    name=str(category.name),
-                    slug=str(category.slug),
-                    description=str(category.description)
-                    if category.description
-                    else None,
-                    parent_id=category.parent_id,
-                    created_at=category.created_at,
-                    updated_at=category.updated_at,
-                )
-                for category in categories
-            ]
-        finally:
-            db.close()
+            return [category_from_row(category) for category in categories]
 
-    def get_category(self, category_id: int) -> Optional[Category]:
-        db = self.get_db()
-        try:
+    def get_category(self, category_id: int, session: Optional[Session] = None) -> Optional[Category]:
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return snapshot.categories_by_id.get(category_id)
+        with self.session_scope(session) as db:
             category = (
                 db.query(CategoryModel).filter(CategoryModel.id == category_id).first()
             )
             if category:
-                return Category(
-                    id=int(category.id),
-                    name=str(category.name),
-                    slug=str(category.slug),
-                    description=str(category.description)
-                    if category.description
-                    else None,
-                    parent_id=category.parent_id,
-                    created_at=category.created_at,
-                    updated_at=category.updated_at,
-                )
+                return category_from_row(category)
             return None
-        finally:
-            db.close()
 
-    def get_category_by_slug(self, slug: str) -> Optional[Category]:
-        db = self.get_db()
-        try:
+    def get_category_by_slug(self, slug: str, session: Optional[Session] = None) -> Optional[Category]:
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return snapshot.categories_by_slug.get(slug)
+        with self.session_scope(session) as db:
             category = (
                 db.query(CategoryModel).filter(CategoryModel.slug == slug).first()
             )
             if category:
-                return Category(
-                    id=int(category.id),
-                    name=str(category.name),
-                    slug=str(category.slug),
-                    description=str(category.description)
-                    if category.description
-                    else None,
-                    parent_id=category.parent_id,
-                    created_at=category.created_at,
-                    updated_at=category.updated_at,
-                )
+                return category_from_row(category)
             return None
-        finally:
-            db.close()
+
+    def get_categories_by_ids(
+        self, category_ids: Iterable[int], session: Optional[Session] = None
+    ) -> Dict[int, Category]:
+        """Get several categories in one query, keyed by id"""
+        ids = {category_id for category_id in category_ids if category_id}
+        if not ids:
+            return {}
+        snapshot = self._reference_data(session)
+        if snapshot is not None:
+            return {
+                category_id: snapshot.categories_by_id[category_id]
+                for category_id in ids
+                if category_id in snapshot.categories_by_id
+            }
+        with self.session_scope(session) as db:
+            categories = (
+                db.query(CategoryModel).filter(CategoryModel.id.in_(ids)).all()
+            )
+            return {
+                category.id: category_from_row(category) for category in categories
+            }
 
     # Station CRUD methods
-    def create_station(self, station_data: StationCreate) -> Station:
-        db = self.get_db()
-        try:
+    def create_station(self, station_data: StationCreate, session: Optional[Session] = None) -> Station:
+        with self.session_scope(session) as db:
             db_station = StationModel(
                 station_code=station_data.station_code,
                 name=station_data.name,
@@ -1098,32 +1930,15 @@ class BlogDatabase:
                 city_id=station_data.city_id,
             )
             db.add(db_station)
-            db.commit()
+            self._commit(db)
             db.refresh(db_station)
 
-            return Station(
-                id=int(db_station.id),
-                station_code=str(db_station.station_code),
-                name=str(db_station.name),
-                address=str(db_station.address),
-                services=db_station.services.split(",") if db_station.services else [],
-                accessibility=db_station.accessibility.split(",")
-                if db_station.accessibility
-                else [],
-                station_type=str(db_station.station_type) if db_station.station_type else None,
-                province=str(db_station.province) if db_station.province else None,
-                city_id=db_station.city_id,
-                created_at=db_station.created_at,
-                updated_at=db_station.updated_at,
-            )
-        finally:
-            db.close()
+            return station_from_row(db_station)
 
     def update_station(
-        self, station_id: int, station_data: StationUpdate
+        self, station_id: int, station_data: StationUpdate, session: Optional[Session] = None
     ) -> Optional[Station]:
-        db = self.get_db()
-        try:
+        with self.session_scope(session) as db:
             db_station = (
                 db.query(StationModel).filter(StationModel.id == station_id).first()
             )
@@ -1146,48 +1961,26 @@ class BlogDatabase:
                     db_station.city_id = station_data.city_id
 
                 db_station.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_station)
 
-                return Station(
-                    id=int(db_station.id),
-                    station_code=str(db_station.station_code),
-                    name=str(db_station.name),
-                    address=str(db_station.address),
-                    services=db_station.services.split(",")
-                    if db_station.services
-                    else [],
-                    accessibility=db_station.accessibility.split(",")
-                    if db_station.accessibility
-                    else [],
-                    station_type=str(db_station.station_type) if db_station.station_type else None,
-                    province=str(db_station.province) if db_station.province else None,
-                    city_id=db_station.city_id,
-                    created_at=db_station.created_at,
-                    updated_at=db_station.updated_at,
-                )
+                return station_from_row(db_station)
             return None
-        finally:
-            db.close()
 
-    def delete_station(self, station_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_station(self, station_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_station = (
                 db.query(StationModel).filter(StationModel.id == station_id).first()
             )
             if db_station:
                 db.delete(db_station)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # Event CRUD methods
-    def create_event(self, event_data: EventCreate) -> Event:
-        db = self.get_db()
-        try:
+    def create_event(self, event_data: EventCreate, session: Optional[Session] = None) -> Event:
+        with self.session_scope(session) as db:
             db_event = EventModel(
                 title=event_data.title,
                 description=event_data.description,
@@ -1198,27 +1991,13 @@ class BlogDatabase:
                 city_id=event_data.city_id,
             )
             db.add(db_event)
-            db.commit()
+            self._commit(db)
             db.refresh(db_event)
 
-            return Event(
-                id=int(db_event.id),
-                title=str(db_event.title),
-                description=str(db_event.description),
-                event_date=db_event.event_date,
-                event_time=str(db_event.event_time),
-                location=str(db_event.location),
-                event_type=str(db_event.event_type),
-                city_id=db_event.city_id,
-                created_at=db_event.created_at,
-                updated_at=db_event.updated_at,
-            )
-        finally:
-            db.close()
+            return event_from_row(db_event)
 
-    def update_event(self, event_id: int, event_data: EventUpdate) -> Optional[Event]:
-        db = self.get_db()
-        try:
+    def update_event(self, event_id: int, event_data: EventUpdate, session: Optional[Session] = None) -> Optional[Event]:
+        with self.session_scope(session) as db:
             db_event = db.query(EventModel).filter(EventModel.id == event_id).first()
             if db_event:
                 if event_data.title is not None:
@@ -1237,41 +2016,24 @@ class BlogDatabase:
                     db_event.city_id = event_data.city_id
 
                 db_event.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_event)
 
-                return Event(
-                    id=int(db_event.id),
-                    title=str(db_event.title),
-                    description=str(db_event.description),
-                    event_date=db_event.event_date,
-                    event_time=str(db_event.event_time),
-                    location=str(db_event.location),
-                    event_type=str(db_event.event_type),
-                    city_id=db_event.city_id,
-                    created_at=db_event.created_at,
-                    updated_at=db_event.updated_at,
-                )
+                return event_from_row(db_event)
             return None
-        finally:
-            db.close()
 
-    def delete_event(self, event_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_event(self, event_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_event = db.query(EventModel).filter(EventModel.id == event_id).first()
             if db_event:
                 db.delete(db_event)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # City CRUD methods
-    def create_city(self, city_data: CityCreate) -> City:
-        db = self.get_db()
-        try:
+    def create_city(self, city_data: CityCreate, session: Optional[Session] = None) -> City:
+        with self.session_scope(session) as db:
             db_city = CityModel(
                 name=city_data.name,
                 slug=city_data.slug,
@@ -1279,24 +2041,13 @@ class BlogDatabase:
                 country=city_data.country,
             )
             db.add(db_city)
-            db.commit()
+            self._commit(db)
             db.refresh(db_city)
 
-            return City(
-                id=int(db_city.id),
-                name=str(db_city.name),
-                slug=str(db_city.slug),
-                region=str(db_city.region),
-                country=str(db_city.country),
-                created_at=db_city.created_at,
-                updated_at=db_city.updated_at,
-            )
-        finally:
-            db.close()
+            return city_from_row(db_city)
 
-    def update_city(self, city_id: int, city_data: CityUpdate) -> Optional[City]:
-        db = self.get_db()
-        try:
+    def update_city(self, city_id: int, city_data: CityUpdate, session: Optional[Session] = None) -> Optional[City]:
+        with self.session_scope(session) as db:
             db_city = db.query(CityModel).filter(CityModel.id == city_id).first()
             if db_city:
                 if city_data.name is not None:
@@ -1309,38 +2060,24 @@ class BlogDatabase:
                     db_city.country = city_data.country
 
                 db_city.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_city)
 
-                return City(
-                    id=int(db_city.id),
-                    name=str(db_city.name),
-                    slug=str(db_city.slug),
-                    region=str(db_city.region),
-                    country=str(db_city.country),
-                    created_at=db_city.created_at,
-                    updated_at=db_city.updated_at,
-                )
+                return city_from_row(db_city)
             return None
-        finally:
-            db.close()
 
-    def delete_city(self, city_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_city(self, city_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_city = db.query(CityModel).filter(CityModel.id == city_id).first()
             if db_city:
                 db.delete(db_city)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # Category CRUD methods
-    def create_category(self, category_data: CategoryCreate) -> Category:
-        db = self.get_db()
-        try:
+    def create_category(self, category_data: CategoryCreate, session: Optional[Session] = None) -> Category:
+        with self.session_scope(session) as db:
             db_category = CategoryModel(
                 name=category_data.name,
                 slug=category_data.slug,
@@ -1348,28 +2085,15 @@ class BlogDatabase:
                 parent_id=category_data.parent_id,
             )
             db.add(db_category)
-            db.commit()
+            self._commit(db)
             db.refresh(db_category)
 
-            return Category(
-                id=int(db_category.id),
-                name=str(db_category.name),
-                slug=str(db_category.slug),
-                description=str(db_category.description)
-                if db_category.description
-                else None,
-                parent_id=db_category.parent_id,
-                created_at=db_category.created_at,
-                updated_at=db_category.updated_at,
-            )
-        finally:
-            db.close()
+            return category_from_row(db_category)
 
     def update_category(
-        self, category_id: int, category_data: CategoryUpdate
+        self, category_id: int, category_data: CategoryUpdate, session: Optional[Session] = None
     ) -> Optional[Category]:
-        db = self.get_db()
-        try:
+        with self.session_scope(session) as db:
             db_category = (
                 db.query(CategoryModel).filter(CategoryModel.id == category_id).first()
             )
@@ -1384,263 +2108,478 @@ class BlogDatabase:
                     db_category.parent_id = category_data.parent_id
 
                 db_category.updated_at = datetime.utcnow()
-                db.commit()
+                self._commit(db)
                 db.refresh(db_category)
 
-                return Category(
-                    id=int(db_category.id),
-                    name=str(db_category.name),
-                    slug=str(db_category.slug),
-                    description=str(db_category.description)
-                    if db_category.description
-                    else None,
-                    parent_id=db_category.parent_id,
-                    created_at=db_category.created_at,
-                    updated_at=db_category.updated_at,
-                )
+                return category_from_row(db_category)
             return None
-        finally:
-            db.close()
 
-    def delete_category(self, category_id: int) -> bool:
-        db = self.get_db()
-        try:
+    def delete_category(self, category_id: int, session: Optional[Session] = None) -> bool:
+        with self.session_scope(session) as db:
             db_category = (
                 db.query(CategoryModel).filter(CategoryModel.id == category_id).first()
             )
             if db_category:
                 db.delete(db_category)
-                db.commit()
+                self._commit(db)
                 return True
             return False
-        finally:
-            db.close()
 
     # Search method for posts
-    def search_posts_paginated(self, query: str, page: int = 1, per_page: int = 5):
-        """Get paginated search results for posts"""
-        db = self.get_db()
-        try:
-            # Count total matching posts
-            total_count = (
-                db.query(PostModel)
-                .filter(
-                    PostModel.is_published == True,
-                    PostModel.title.contains(query) | PostModel.content.contains(query),
-                )
-                .count()
+    def search_posts_paginated(self, query: str, page: int = 1, per_page: int = 5, session: Optional[Session] = None):
+        """Get paginated search results for posts, best matches first"""
+        with self.session_scope(session) as db:
+            search_query, score = apply_text_search(
+                db, db.query(PostModel).filter(PostModel.is_published == True), PostModel, query
             )
+
+            # Count total matching posts
+            total_count = cached_count(("search_posts", query), search_query)
             total_pages = (total_count + per_page - 1) // per_page
 
             # Get posts for current page
             skip = (page - 1) * per_page
             posts = (
-                db.query(PostModel)
-                .filter(
-                    PostModel.is_published == True,
-                    PostModel.title.contains(query) | PostModel.content.contains(query),
-                )
-                .order_by(desc(PostModel.created_at))
+                search_query.order_by(*_by_relevance(score, PostModel.created_at))
                 .offset(skip)
                 .limit(per_page)
                 .all()
             )
 
-            post_list = [
-                Post(
-                    id=int(post.id),
-                    title=str(post.title),
-                    content=str(post.content),
-                    author=str(post.author),
-                    is_published=bool(post.is_published),
-                    created_at=post.created_at,
-                    updated_at=post.updated_at,
-                )
-                for post in posts
-            ]
+            post_list = [post_from_row(post) for post in posts]
 
             return post_list, total_pages
-        finally:
-            db.close()
 
-    def search_all_paginated(self, query: str, page: int = 1, per_page: int = 10):
-        """Get paginated search results across all entities"""
-        db = self.get_db()
-        try:
-            all_results = []
-            
-            # Search in Posts
-            posts = (
-                db.query(PostModel)
-                .filter(
-                    PostModel.is_published == True,
-                    PostModel.title.contains(query) | PostModel.content.contains(query),
-                )
-                .all()
+    def search_posts_cursor(
+        self,
+        query: str,
+        cursor: Optional[str] = None,
+        per_page: int = 5,
+        with_total: bool = False,
+        session: Optional[Session] = None,
+    ) -> CursorPage:
+        """Get a page of post search results using keyset pagination on (created_at, id).
+
+        Results are in date order, not by relevance: the cursor is a position
+        in (created_at, id).
+        """
+        with self.session_scope(session) as db:
+            search_query, _ = apply_text_search(
+                db, db.query(PostModel).filter(PostModel.is_published == True), PostModel, query
             )
-            for post in posts:
-                all_results.append({
-                    'type': 'post',
-                    'id': post.id,
-                    'title': post.title,
-                    'description': post.content[:200] if post.content else '',
-                    'url': f'/post/{post.id}',
-                    'author': post.author,
-                    'date': post.created_at,
-                })
-            
-            # Search in Lines
-            lines = (
-                db.query(LineModel)
-                .filter(
-                    LineModel.line_number.contains(query) | 
-                    LineModel.description.contains(query)
-                )
-                .all()
+
+            posts, next_cursor, prev_cursor = keyset_paginate(
+                search_query, PostModel.created_at, PostModel.id, cursor, per_page
             )
-            for line in lines:
-                all_results.append({
-                    'type': 'line',
-                    'id': line.id,
-                    'title': f'Línea {line.line_number}',
-                    'description': line.description[:200] if line.description else '',
-                    'url': f'/lines/{line.id}',
-                    'date': line.created_at,
-                })
-            
-            # Search in Stations
-            stations = (
-                db.query(StationModel)
-                .filter(
-                    StationModel.name.contains(query) | 
-                    StationModel.station_code.contains(query) |
-                    StationModel.address.contains(query)
+            total_count = (
+                cached_count(("search_posts", query), search_query)
+                if with_total
+                else None
+            )
+
+            post_list = [post_from_row(post) for post in posts]
+
+            return CursorPage(post_list, next_cursor, prev_cursor, total_count)
+
+    @reads_indexes(search_index)
+    @single_flight
+    def search_all_paginated(
+        self,
+        query: str,
+        page: int = 1,
+        per_page: int = 10,
+        facets: bool = False,
+        session: Optional[Session] = None,
+    ):
+        """Get paginated search results across all entities, best matches first.
+
+        With SEARCH_BACKEND=index (the default) this searches the in-memory
+        index, which also covers events. Otherwise the per-entity SQL searches
+        are combined with UNION ALL and ordered and paginated in SQL, so only
+        one page of rows is fetched; the total comes from a COUNT(*) OVER ()
+        on the same query.
+
+        With ``facets=True`` returns ``(results, total_pages, facet_counts)``,
+        the counts (see facet_list) covering every match, not just the page.
+        The index counts them while collecting hits; SQL in one GROUP BY.
+        """
+        with self.session_scope(session) as db:
+            if SEARCH_BACKEND == "index":
+                return self._search_all_indexed(db, query, page, per_page, facets)
+
+            def search(model, entity_type, title, description, author=None, code=None,
+                       region=None, country=None, facet=None, published_only=False):
+                # Every branch has the same columns so they can be UNIONed
+                branch = db.query(
+                    literal(entity_type).label("type"),
+                    model.id.label("id"),
+                    title.label("title"),
+                    description.label("description"),
+                    (author if author is not None else null()).label("author"),
+                    (code if code is not None else null()).label("code"),
+                    (region if region is not None else null()).label("region"),
+                    (country if country is not None else null()).label("country"),
+                    (facet if facet is not None else null()).label("facet"),
+                    model.created_at.label("date"),
                 )
-                .all()
+                if published_only:
+                    branch = branch.filter(model.is_published == True)
+                branch, score = apply_text_search(db, branch, model, query)
+                return branch.add_columns(
+                    (score if score is not None else literal(0.0)).label("score")
+                ).statement
+
+            matches = union_all(
+                search(
+                    PostModel, 'post', PostModel.title,
+                    func.substr(PostModel.content, 1, 200),
+                    author=PostModel.author, facet=PostModel.category, published_only=True,
+                ),
+                search(
+                    LineModel, 'line', LineModel.line_number,
+                    func.substr(LineModel.description, 1, 200), facet=LineModel.gauge_type,
+                ),
+                search(
+                    StationModel, 'station', StationModel.name,
+                    func.substr(StationModel.address, 1, 150),
+                    code=StationModel.station_code, facet=StationModel.province,
+                ),
+                search(
+                    ProjectModel, 'project', ProjectModel.title,
+                    func.substr(ProjectModel.description, 1, 200), facet=ProjectModel.status,
+                ),
+                search(
+                    CityModel, 'city', CityModel.name, null(),
+                    code=CityModel.slug, region=CityModel.region, country=CityModel.country,
+                ),
+            ).subquery()
+
+            # Sort by relevance, then by date (most recent first), and paginate
+            skip = (page - 1) * per_page
+            rows = db.execute(
+                select(matches, func.count().over().label("total_count"))
+                .order_by(
+                    desc(matches.c.score), desc(matches.c.date), matches.c.type, desc(matches.c.id)
+                )
+                .offset(skip)
+                .limit(per_page)
+            ).all()
+            if rows:
+                total_count = rows[0].total_count
+            else:
+                # Past the last page: the window total isn't available
+                total_count = db.execute(select(func.count()).select_from(matches)).scalar()
+            total_pages = (total_count + per_page - 1) // per_page
+            results = [self._search_result(row) for row in rows]
+            if not facets:
+                return results, total_pages
+
+            counts = {}
+            grouped = db.execute(
+                select(matches.c.type, matches.c.facet, func.count())
+                .group_by(matches.c.type, matches.c.facet)
             )
-            for station in stations:
-                all_results.append({
-                    'type': 'station',
-                    'id': station.id,
-                    'title': station.name,
-                    'description': f'{station.station_code} - {station.address[:150]}' if station.address else station.station_code,
-                    'url': f'/stations/{station.id}',
-                    'date': station.created_at,
-                })
-            
-            # Search in Projects
-            projects = (
-                db.query(ProjectModel)
-                .filter(
-                    ProjectModel.title.contains(query) | 
-                    ProjectModel.description.contains(query)
+            for entity_type, value, count in grouped:
+                counts.setdefault('type', Counter())[entity_type] += count
+                if value and entity_type in SEARCH_FACETS:
+                    counts.setdefault(SEARCH_FACETS[entity_type], Counter())[value] += count
+            return results, total_pages, facet_list(counts)
+
+    def sync_content_versions(self, session: Optional[Session] = None) -> set:
+        """Drop caches of entity types another process changed.
+
+        Reads content_versions at most every CONTENT_VERSION_CHECK_INTERVAL
+        seconds and returns the types found stale. The first read drops
+        everything, since caches may predate it.
+        """
+        global _content_versions_checked
+        now = time.monotonic()
+        if now - _content_versions_checked < CONTENT_VERSION_CHECK_INTERVAL:
+            return set()
+        _content_versions_checked = now
+        with self.session_scope(session) as db:
+            versions = dict(
+                db.query(ContentVersionModel.entity_type, ContentVersionModel.version).all()
+            )
+            with _content_versions_lock:
+                seen = {entity_type: _content_versions.get(entity_type) for entity_type in versions}
+                stale = {entity_type for entity_type, version in versions.items() if seen[entity_type] != version}
+                _content_versions.update(versions)
+            if stale:
+                for listener in _remote_change_listeners:
+                    listener(stale)
+                self._apply_remote_changes(db, stale, seen, versions)
+        return stale
+
+    def _apply_remote_changes(self, db: Session, stale: set, seen: Dict[str, Optional[int]], versions: Dict[str, int]):
+        """Bring the in-memory indexes up to date with other processes' writes
+        to ``stale`` types: row by row from content_changes, or by dropping the
+        indexes of a type whose log doesn't cover every version since ``seen``"""
+        indexed = set()
+        for _, index_types in _memory_indexes.values():
+            indexed.update(CONTENT_TYPES if index_types is None else index_types)
+        changes, unknown = [], set()
+        for entity_type in stale & indexed:
+            since, version = seen[entity_type], versions[entity_type]
+            if since is None or since > version:
+                unknown.add(entity_type)
+                continue
+            logged = db.query(ContentChangeModel.version, ContentChangeModel.entity_id).filter(
+                ContentChangeModel.entity_type == entity_type,
+                ContentChangeModel.version > since,
+                ContentChangeModel.version <= version,
+            ).all()
+            if {logged_version for logged_version, _ in logged} != set(range(since + 1, version + 1)):
+                unknown.add(entity_type)
+                continue
+            ids = {entity_id for _, entity_id in logged}
+            model = MODELS_BY_TYPE[entity_type]
+            to_model = ENTITY_TYPES[model][1]
+            rows = {row.id: to_model(row) for row in db.query(model).filter(model.id.in_(ids))}
+            changes.extend((entity_type, entity_id, rows.get(entity_id)) for entity_id in ids)
+        for index, (_, index_types) in _memory_indexes.items():
+            if index_types is None or unknown.intersection(index_types):
+                index.invalidate()
+        if changes:
+            _update_indexes(changes)
+
+    def load_reference_data(self, session: Optional[Session] = None) -> ReferenceSnapshot:
+        """Load the cities and categories snapshot now instead of on first use"""
+        global _reference_snapshot
+        while True:
+            version = _reference_version
+            with self.session_scope(session) as db:
+                cities = [city_from_row(city) for city in db.query(CityModel)]
+                categories = [category_from_row(category) for category in db.query(CategoryModel)]
+            with _reference_lock:
+                # A commit during the load may be missing from it: load again
+                if version == _reference_version:
+                    _reference_snapshot = ReferenceSnapshot.build(cities, categories)
+                    return _reference_snapshot
+
+    def _reference_data(self, session: Optional[Session] = None) -> Optional[ReferenceSnapshot]:
+        """The reference snapshot, or None if ``session`` holds uncommitted city
+        or category changes, which only the database can show it"""
+        if session is not None:
+            if any(entity_type in REFERENCE_TYPES for entity_type, _ in session.info.get("changes", ())):
+                return None
+            if any(
+                type(instance) in (CityModel, CategoryModel)
+                for instance in (*session.new, *session.dirty, *session.deleted)
+            ):
+                return None
+        return _reference_snapshot or self.load_reference_data(session)
+
+    def load_indexes(self, indexes: Optional[Iterable] = None, session: Optional[Session] = None):
+        """Load the in-memory ``indexes`` (default: all) now instead of on first use"""
+        with self.session_scope(session) as db:
+            for index in _memory_indexes if indexes is None else indexes:
+                self._built_index(db, index)
+
+    def _built_index(self, db: Session, index):
+        """A registered in-memory index, loaded through ``db`` the first time"""
+        to_document, entity_types = _memory_indexes[index]
+        index.ensure_built(lambda: self._index_documents(db, to_document, entity_types))
+        return index
+
+    def _index_documents(
+        self, db: Session, to_document: Callable, entity_types: Optional[Iterable[str]] = None
+    ) -> Iterable[Document]:
+        """Every Document ``to_document`` builds from the rows of ``entity_types``"""
+        for model, (entity_type, to_model) in ENTITY_TYPES.items():
+            if entity_types is not None and entity_type not in entity_types:
+                continue
+            query = db.query(model)
+            if model is PostModel:
+                query = query.filter(PostModel.is_published == True)
+            for row in query:
+                document = to_document(entity_type, to_model(row))
+                if document is not None:
+                    yield document
+
+    @reads_indexes(autocomplete_index)
+    def autocomplete(self, query: str, limit: int = 8, session: Optional[Session] = None) -> List[dict]:
+        """Stations, cities and lines whose name, code or number starts with ``query``.
+
+        Served from an in-memory prefix index; the database is only read the
+        first time, to build it.
+        """
+        with self.session_scope(session) as db:
+            index = self._built_index(db, autocomplete_index)
+            return [document.data for document in index.lookup(query, limit)]
+
+    @reads_indexes(spelling_index)
+    def suggest_query(self, query: str, session: Optional[Session] = None) -> Optional[str]:
+        """A spelling correction for ``query`` from titles and names, or None"""
+        with self.session_scope(session) as db:
+            return self._built_index(db, spelling_index).suggest(query)
+
+    def content_versions(self, entity_types: Iterable[str], session: Optional[Session] = None) -> tuple:
+        """Versions of ``entity_types`` (sorted by type) that this process's
+        caches reflect. They move with every write, in whichever process, and
+        are the same in every process once it has synced."""
+        if not _content_versions:
+            self.sync_content_versions(session)
+        return tuple(_content_versions.get(entity_type) for entity_type in sorted(entity_types))
+
+    def _search_all_indexed(self, db: Session, query: str, page: int, per_page: int, facets: bool = False):
+        skip = (page - 1) * per_page
+        hits, total_count, counts = self._built_index(db, search_index).search_faceted(
+            query, limit=skip + per_page, facets=search_facets if facets else None
+        )
+        results = [dict(document.data, score=score) for score, document in hits[skip:]]
+        total_pages = (total_count + per_page - 1) // per_page
+        if facets:
+            return results, total_pages, facet_list(counts)
+        return results, total_pages
+
+    @staticmethod
+    def _search_result(row) -> dict:
+        """Result dict for one search_all_paginated row"""
+        result = {
+            'type': row.type,
+            'id': row.id,
+            'title': row.title,
+            'description': row.description or '',
+            'date': row.date,
+            'score': row.score,
+        }
+        if row.type == 'post':
+            result['url'] = f'/post/{row.id}'
+            result['author'] = row.author
+        elif row.type == 'line':
+            result['title'] = f'Línea {row.title}'
+            result['url'] = f'/lines/{row.id}'
+        elif row.type == 'station':
+            result['description'] = f'{row.code} - {row.description}' if row.description else row.code
+            result['url'] = f'/stations/{row.id}'
+        elif row.type == 'project':
+            result['url'] = f'/projects/{row.id}'
+        else:
+            result['description'] = f'{row.region}, {row.country}' if row.region else row.country
+            result['url'] = f'/cities/{row.code}' if row.code else f'/cities/{row.id}'
+        return result
+
+    # Sidebar of every page: only rebuilt after one of these types changes
+    @read_through(("post", "line", "station", "project", "city"), ttl=24 * 3600, maxsize=8)
+    def get_recent_entries(self, limit: int = 5, session: Optional[Session] = None) -> List[dict]:
+        """Get the most recent entries from all entities (posts, lines, stations, projects, cities)"""
+        with self.session_scope(session) as db:
+            rows = (
+                db.query(
+                    ActivityFeedModel.entity_type,
+                    ActivityFeedModel.title,
+                    ActivityFeedModel.url,
+                    ActivityFeedModel.updated_at,
                 )
+                .order_by(desc(ActivityFeedModel.updated_at))
+                .limit(limit)
                 .all()
             )
-            for project in projects:
-                all_results.append({
-                    'type': 'project',
-                    'id': project.id,
-                    'title': project.title,
-                    'description': project.description[:200] if project.description else '',
-                    'url': f'/projects/{project.id}',
-                    'date': project.created_at,
-                })
-            
-            # Search in Cities
-            cities = (
-                db.query(CityModel)
-                .filter(
-                    CityModel.name.contains(query) | 
-                    CityModel.region.contains(query)
+            return [
+                {'type': row.entity_type, 'title': row.title, 'url': row.url, 'updated_at': row.updated_at}
+                for row in rows
+            ]
+
+
+class AsyncBlogDatabase:
+    """Async counterpart of BlogDatabase with the same method surface.
+
+    Every public BlogDatabase method is exposed here as a coroutine that runs
+    the sync implementation through ``AsyncSession.run_sync``, so database
+    I/O goes through the async driver and doesn't block the event loop. The
+    Python code around it does run on the loop; building an in-memory index
+    (every row it covers, CPU-bound) is therefore done by ``load_indexes`` in
+    a worker thread, with a sync session of its own, before a method marked
+    ``reads_indexes`` runs.
+    """
+
+    def __init__(self, sync_db: Optional[BlogDatabase] = None):
+        self.sync_db = sync_db or BlogDatabase()
+
+    @asynccontextmanager
+    async def session_scope(self, session: Optional[AsyncSession] = None):
+        """Use the given async session, or open (and close) a new one for this call"""
+        if session is not None:
+            yield session
+            return
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    async def load_indexes(self, indexes: Optional[Iterable] = None):
+        """Build the in-memory ``indexes`` (default: all) not built yet, in a
+        worker thread"""
+        indexes = list(_memory_indexes if indexes is None else indexes)
+        if not all(index.built for index in indexes):
+            await asyncio.to_thread(self.sync_db.load_indexes, indexes)
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """One session and one transaction, committed if the block exits
+        normally and rolled back if it raises. Writes through the session
+        only flush (see BlogDatabase._commit); to drop them without raising,
+        roll back inside the block."""
+        async with AsyncSessionLocal() as db:
+            db.info["unit_of_work"] = True
+            try:
+                yield db
+            except Exception:
+                await db.rollback()
+                raise
+            await db.commit()
+
+
+def _make_async_method(name: str):
+    sync_method = getattr(BlogDatabase, name)
+
+    indexes = getattr(sync_method, "indexes", ())
+
+    async def run(self, args, kwargs, session):
+        if indexes:
+            await self.load_indexes(indexes)
+        async with self.session_scope(session) as db:
+            return await db.run_sync(
+                lambda sync_session: sync_method(
+                    self.sync_db, *args, session=sync_session, **kwargs
                 )
-                .all()
             )
-            for city in cities:
-                all_results.append({
-                    'type': 'city',
-                    'id': city.id,
-                    'title': city.name,
-                    'description': f'{city.region}, {city.country}' if city.region else city.country,
-                    'url': f'/cities/{city.slug}' if city.slug else f'/cities/{city.id}',
-                    'date': city.created_at,
-                })
-            
-            # Sort by date (most recent first)
-            all_results.sort(key=lambda x: x['date'] if x['date'] else datetime.min, reverse=True)
-            
-            # Paginate
-            total_count = len(all_results)
-            total_pages = (total_count + per_page - 1) // per_page
-            skip = (page - 1) * per_page
-            paginated_results = all_results[skip:skip+per_page]
-            
-            return paginated_results, total_pages
-        finally:
-            db.close()
 
-    def get_recent_entries(self, limit: int = 5) -> List[dict]:
-        """Get the most recent entries from all entities (posts, lines, stations, projects, cities)"""
-        db = self.get_db()
-        try:
-            entries = []
-            
-            # Get recent posts
-            posts = db.query(PostModel).filter(PostModel.is_published == True).order_by(desc(PostModel.updated_at)).limit(limit * 2).all()
-            for post in posts:
-                entries.append({
-                    'type': 'post',
-                    'title': post.title,
-                    'url': f'/post/{post.id}',
-                    'updated_at': post.updated_at or post.created_at,
-                })
-            
-            # Get recent lines
-            lines = db.query(LineModel).order_by(desc(LineModel.updated_at)).limit(limit * 2).all()
-            for line in lines:
-                entries.append({
-                    'type': 'line',
-                    'title': f'Línea {line.line_number}',
-                    'url': f'/lines/{line.id}',
-                    'updated_at': line.updated_at or line.created_at,
-                })
-            
-            # Get recent stations
-            stations = db.query(StationModel).order_by(desc(StationModel.updated_at)).limit(limit * 2).all()
-            for station in stations:
-                entries.append({
-                    'type': 'station',
-                    'title': station.name,
-                    'url': f'/stations/{station.id}',
-                    'updated_at': station.updated_at or station.created_at,
-                })
-            
-            # Get recent projects
-            projects = db.query(ProjectModel).order_by(desc(ProjectModel.updated_at)).limit(limit * 2).all()
-            for project in projects:
-                entries.append({
-                    'type': 'project',
-                    'title': project.title,
-                    'url': f'/projects/{project.id}',
-                    'updated_at': project.updated_at or project.created_at,
-                })
-            
-            # Get recent cities
-            cities = db.query(CityModel).order_by(desc(CityModel.updated_at)).limit(limit * 2).all()
-            for city in cities:
-                entries.append({
-                    'type': 'city',
-                    'title': city.name,
-                    'url': f'/cities/{city.slug}',
-                    'updated_at': city.updated_at or city.created_at,
-                })
-            
-            # Sort all entries by updated_at descending and take the most recent ones
-            entries.sort(key=lambda x: x['updated_at'], reverse=True)
-            return entries[:limit]
-        finally:
-            db.close()
+    if not getattr(sync_method, "single_flight", False):
+
+        @functools.wraps(sync_method)
+        async def async_method(
+            self, *args, session: Optional[AsyncSession] = None, **kwargs
+        ):
+            return await run(self, args, kwargs, session)
+
+        return async_method
+
+    # Concurrent requests for the same read share one run (and its session)
+    flights = AsyncSingleFlight()
+    signature = inspect.signature(sync_method)
+
+    @functools.wraps(sync_method)
+    async def coalesced_async_method(
+        self, *args, session: Optional[AsyncSession] = None, **kwargs
+    ):
+        key = call_key(signature, args, kwargs)
+        if key is None or (session is not None and session.info.get("changes")):
+            return await run(self, args, kwargs, session)
+        result = await flights.do((id(self), key), lambda: run(self, args, kwargs, session))
+        return list(result) if isinstance(result, list) else result
+
+    return coalesced_async_method
+
+
+for _name, _attr in list(vars(BlogDatabase).items()):
+    if (
+        not _name.startswith("_")
+        and callable(_attr)
+        and _name not in ("get_db", "session_scope", "unit_of_work", "load_indexes")
+    ):
+        setattr(AsyncBlogDatabase, _name, _make_async_method(_name))
 
 
-# Create database instance
+# Create database instances
 db = BlogDatabase()
+async_db = AsyncBlogDatabase(db)
@@ -1,9 +1,16 @@
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from collections import Counter
+from typing import Dict, NamedTuple, Optional, Tuple
+import asyncio
+import glob
+import hashlib
 import logging
+import os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -37,7 +44,14 @@ from models import (
     CategoryCreate,
     CategoryUpdate,
 )
-from database import db
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import CacheBackend, SQLiteCache, TTLCache
+from database import (
+    async_db as db,
+    db_usage,
+    read_cache_stats,
+    CursorPage,
+)
 from auth import (
     AuthMiddleware,
     ADMIN_PASSWORD,
@@ -48,15 +62,43 @@ from auth import (
 
 
 class Pagination:
-    def __init__(self, page: int, total_pages: int, per_page: int = 5):
+    def __init__(
+        self,
+        page: int,
+        total_pages: int,
+        per_page: int = 5,
+        next_cursor: Optional[str] = None,
+        prev_cursor: Optional[str] = None,
+    ):
         self.page = page
         self.total_pages = total_pages
         self.per_page = per_page
-        self.has_prev = page > 1
-        self.has_next = page < total_pages
+        # Cursor mode: links carry opaque keyset tokens instead of page numbers
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.is_cursor = next_cursor is not None or prev_cursor is not None
+        if self.is_cursor:
+            self.has_prev = prev_cursor is not None
+            self.has_next = next_cursor is not None
+        else:
+            self.has_prev = page > 1
+            self.has_next = page < total_pages
         self.prev_num = page - 1 if self.has_prev else None
         self.next_num = page + 1 if self.has_next else None
 
+    @classmethod
+    def from_cursor_page(cls, cursor_page: CursorPage, per_page: int = 5):
+        """Build a cursor-mode pagination from a keyset-paginated result"""
+        total_count = cursor_page.total_count or 0
+        total_pages = (total_count + per_page - 1) // per_page
+        return cls(
+            page=1,
+            total_pages=total_pages,
+            per_page=per_page,
+            next_cursor=cursor_page.next_cursor,
+            prev_cursor=cursor_page.prev_cursor,
+        )
+
     def iter_pages(self):
         """Generate page numbers for pagination display."""
         left_edge = 2
@@ -86,25 +128,85 @@ class Pagination:
                     last = num
 
 
-app = FastAPI(title="Blog API", description="A simple blog built with FastAPI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cities and categories are served from memory, and search, autocomplete
+    # and name lookups from in-memory indexes: load them before serving
+    try:
+        await db.sync_content_versions()
+        await db.load_reference_data()
+        await db.load_indexes()
+    except Exception as e:
+        # E.g. migrations not applied yet; the first read loads them instead
+        logger.warning(f"Could not preload reference data: {e}")
+    yield
+
+
+app = FastAPI(
+    title="Blog API", description="A simple blog built with FastAPI", lifespan=lifespan
+)
 
 # Add authentication middleware
 # app.add_middleware(AuthMiddleware)  # Temporarily disabled
 
 
+@app.middleware("http")
+async def db_session_middleware(request: Request, call_next):
+    """Give each request one database session and one transaction.
+
+    The session is committed before the response is returned (or rolled back
+    on errors and error responses), and the number of sessions/pool checkouts
+    used is reported in the X-DB-Transactions and X-DB-Checkouts headers.
+    """
+    if request.url.path.startswith("/static"):
+        return await call_next(request)
+
+    usage = {"transactions": 0, "checkouts": 0}
+    token = db_usage.set(usage)
+    try:
+        async with db.unit_of_work() as session:
+            request.state.db_session = session
+            response = await call_next(request)
+            # unit_of_work commits on the way out: keep nothing of a failure
+            if response.status_code >= 400:
+                await session.rollback()
+    finally:
+        db_usage.reset(token)
+
+    response.headers["X-DB-Transactions"] = str(usage["transactions"])
+    response.headers["X-DB-Checkouts"] = str(usage["checkouts"])
+    logger.debug(
+        "%s %s: %d transaction(s), %d pool checkout(s)",
+        request.method,
+        request.url.path,
+        usage["transactions"],
+        usage["checkouts"],
+    )
+    return response
+
+
+async def get_session(request: Request) -> AsyncSession:
+    """Request-scoped session opened by db_session_middleware"""
+    return request.state.db_session
+
+
 def is_authenticated(request: Request) -> bool:
     """Check if user is authenticated."""
     auth_token = request.cookies.get("auth_token")
     return auth_token == SECRET_KEY
 
 
-def get_template_context(request: Request) -> dict:
+async def get_template_context(request: Request) -> dict:
     """Get common template context for all pages"""
     try:
-        recent_entries = db.get_recent_entries(limit=5)
+        recent_entries = await db.get_recent_entries(
+            limit=5, session=request.state.db_session
+        )
     except Exception as e:
         print(f"Error getting recent entries: {e}")
         recent_entries = []
+        # Render without the sidebar, but don't cache the page like that
+        request.state.page_incomplete = True
 
     return {
         "is_admin": is_authenticated(request),
@@ -135,30 +237,246 @@ def strip_html(text):
 templates.env.filters["strip_html"] = strip_html
 
 
-def render_template(request: Request, template_name: str, context: dict = None):
+async def render_template(request: Request, template_name: str, context: dict = None):
     """Helper function to render template with common context"""
     if context is None:
         context = {}
     # Merge common context with provided context
-    common_context = get_template_context(request)
+    common_context = await get_template_context(request)
     context.update(common_context)
     return templates.TemplateResponse(template_name, {"request": request, **context})
 
 
+# Full-page cache for public pages, keyed on path, query string and admin
+# flag. Each page lists the entity types it shows besides the recent-entries
+# sidebar; its ETag comes from their content versions, so a write to any of
+# them (in any worker) makes the cached copy out of date, and a matching
+# If-None-Match is answered with 304 without rendering. Listing pages with a
+# max_stale keep serving an out-of-date or expired copy for up to that many
+# seconds while a background task renders a fresh one
+# (stale-while-revalidate); the others are rendered in the request. With
+# PAGE_CACHE_PATH set, pages are kept in that SQLite file, shared by every
+# worker on the host, instead of in each process; page_cache calls may then
+# wait on the file, so they run in the threadpool.
+SIDEBAR_TYPES = ("post", "line", "station", "project", "city")
+
+
+class CachedRoute(NamedTuple):
+    name: str
+    pattern: re.Pattern
+    entity_types: Tuple[str, ...]
+    max_stale: int = 0
+
+
+CACHED_PAGES = [
+    CachedRoute("home", re.compile(r"/"), ("post",)),
+    CachedRoute("lines", re.compile(r"/lines"), ("line",), max_stale=30),
+    CachedRoute(
+        "stations", re.compile(r"/stations"), ("station", "city"), max_stale=30
+    ),
+    CachedRoute(
+        "projects",
+        re.compile(r"/projects"),
+        ("project", "category", "city"),
+        max_stale=30,
+    ),
+    CachedRoute(
+        "cities",
+        re.compile(r"/cities"),
+        ("city", "line", "station", "project"),
+        max_stale=60,
+    ),
+    CachedRoute("city", re.compile(r"/cities/[^/]+"), ("city",)),
+    CachedRoute("page", re.compile(r"/pages/[^/]+"), ("page",)),
+    CachedRoute("post", re.compile(r"/post/\d+"), ("post",)),
+]
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "300"))
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH")
+page_cache: CacheBackend = (
+    SQLiteCache(PAGE_CACHE_PATH, "pages", PAGE_CACHE_TTL, maxsize=512)
+    if PAGE_CACHE_PATH
+    else TTLCache(PAGE_CACHE_TTL, maxsize=512)
+)
+# Per route: hit, stale, miss, not_modified and refresh(_failed) counts
+page_cache_counts = {route.name: Counter() for route in CACHED_PAGES}
+# Background renders in flight, by cache key (also keeps the tasks alive)
+_page_refreshes: Dict[tuple, asyncio.Task] = {}
+# Part of every ETag, so a deploy (new code or templates) changes them all;
+# the same in every worker, which share cached pages
+_BUILD_ID = os.getenv("BUILD_ID") or str(
+    max(
+        os.path.getmtime(path)
+        for path in [__file__, *glob.glob("templates/**/*.html", recursive=True)]
+    )
+)
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    media_type: str
+    etag: str
+
+
+def cached_route(request: Request) -> Optional[CachedRoute]:
+    """The CACHED_PAGES entry for the request, or None if it isn't cached"""
+    if request.method != "GET":
+        return None
+    for route in CACHED_PAGES:
+        if route.pattern.fullmatch(request.url.path):
+            return route
+    return None
+
+
+def page_etag(key: tuple, versions: tuple) -> str:
+    digest = hashlib.sha1(repr((_BUILD_ID, key, versions)).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def page_headers(etag: str) -> dict:
+    # Pages differ by auth cookie: browsers may keep them but must revalidate
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
+
+
+def page_cache_stats() -> dict:
+    # Of the pages looked up (304s aside), the share served up to date
+    totals = sum(page_cache_counts.values(), Counter())
+    lookups = totals["hit"] + totals["stale"] + totals["miss"]
+    return {
+        **page_cache.stats(),
+        "hit_rate": totals["hit"] / lookups if lookups else 0.0,
+        "refreshing": len(_page_refreshes),
+        "routes": {name: dict(counts) for name, counts in page_cache_counts.items()},
+    }
+
+
+async def _refresh_page(scope: dict, route: CachedRoute, key: tuple):
+    """Render the page again through the whole app, so page_cache_middleware
+    stores it, and throw the response away"""
+    sent = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await sent.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            sent.set()
+
+    try:
+        await app(scope, receive, send)
+        page_cache_counts[route.name]["refresh"] += 1
+    except Exception:
+        page_cache_counts[route.name]["refresh_failed"] += 1
+        logger.exception("Background refresh of %s failed", scope["path"])
+    finally:
+        sent.set()
+        _page_refreshes.pop(key, None)
+
+
+def refresh_page_later(request: Request, route: CachedRoute, key: tuple):
+    if key in _page_refreshes:
+        return
+    scope = {
+        **request.scope,
+        "page_cache_refresh": True,
+        "state": dict(request.scope.get("state", {})),
+    }
+    _page_refreshes[key] = asyncio.create_task(_refresh_page(scope, route, key))
+
+
+@app.middleware("http")
+async def page_cache_middleware(request: Request, call_next):
+    """Serve public pages from page_cache and answer If-None-Match with 304"""
+    route = cached_route(request)
+    if route is None:
+        return await call_next(request)
+
+    entity_types = frozenset(SIDEBAR_TYPES + route.entity_types)
+    counts = page_cache_counts[route.name]
+    key = (request.url.path, request.url.query, is_authenticated(request))
+    etag = page_etag(key, await db.content_versions(entity_types))
+    refreshing = request.scope.get("page_cache_refresh", False)
+    if not refreshing:
+        if etag in request.headers.get("if-none-match", ""):
+            counts["not_modified"] += 1
+            return Response(status_code=304, headers=page_headers(etag))
+        page, stale = await run_in_threadpool(
+            page_cache.get_stale, key, route.max_stale
+        )
+        if page is not None and page.etag == etag and not stale:
+            counts["hit"] += 1
+            headers = {**page_headers(etag), "X-Page-Cache": "hit"}
+            return Response(page.body, media_type=page.media_type, headers=headers)
+        if page is not None and route.max_stale:
+            # Serve what we have, validated by its own (old) ETag
+            counts["stale"] += 1
+            refresh_page_later(request, route, key)
+            headers = {**page_headers(page.etag), "X-Page-Cache": "stale"}
+            return Response(page.body, media_type=page.media_type, headers=headers)
+        counts["miss"] += 1
+
+    response = await call_next(request)
+    # A page rendered around a failed read (request.state.page_incomplete)
+    # would be served to everyone until the next write: don't keep it
+    if (
+        response.status_code != 200
+        or "set-cookie" in response.headers
+        or getattr(request.state, "page_incomplete", False)
+    ):
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    media_type = response.headers.get("content-type", "text/html; charset=utf-8")
+    await run_in_threadpool(page_cache.set, key, CachedPage(body, media_type, etag))
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+    headers.update(page_headers(etag), **{"X-Page-Cache": "miss"})
+    return Response(body, media_type=media_type, headers=headers)
+
+
+@app.middleware("http")
+async def content_versions_middleware(request: Request, call_next):
+    """Drop caches another worker made stale, before anything reads them"""
+    if not request.url.path.startswith("/static"):
+        await db.sync_content_versions()
+    return await call_next(request)
+
+
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
+async def home(
+    request: Request,
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+):
     # Show the actual home page with sections
     try:
-        posts = db.get_posts(skip=0, limit=5, published_only=True)
-        print(f"Posts loaded: {len(posts)}")
+        posts_page = await db.get_published_posts_cursor(
+            cursor=cursor,
+            per_page=5,
+            with_total=True,
+            summary=True,
+            session=session,
+        )
+        print(f"Posts loaded: {len(posts_page.items)}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         print(f"Error getting posts: {e}")
-        posts = []
+        posts_page = CursorPage([], None, None, 0)
+        request.state.page_incomplete = True
+    posts = posts_page.items
 
     try:
-        context = get_template_context(request)
-        # Create a simple pagination object
-        pagination = Pagination(page=1, total_pages=1, per_page=5)
+        context = await get_template_context(request)
+        # Keyset pagination: deep pages cost the same as the first one
+        pagination = Pagination.from_cursor_page(posts_page, per_page=5)
 
         context.update(
             {
@@ -176,24 +494,55 @@ async def home(request: Request):
         import traceback
 
         traceback.print_exc()
-        return HTMLResponse(f"<h1>Error loading page: {e}</h1>")
+        return HTMLResponse(f"<h1>Error loading page: {e}</h1>", status_code=500)
 
-    results, total_pages = db.search_all_paginated(q, page, per_page=10)
+
+@app.get("/search", response_class=HTMLResponse)
+async def search(
+    request: Request,
+    q: str = "",
+    page: int = 1,
+    session: AsyncSession = Depends(get_session),
+):
+    results, total_pages, facets = await db.search_all_paginated(
+        q, page, per_page=10, facets=True, session=session
+    )
+    suggestion = None
+    if not results and q.strip():
+        suggestion = await db.suggest_query(q, session=session)
     pagination = Pagination(page, total_pages, per_page=10)
-    return render_template(
+    return await render_template(
         request,
         "search.html",
         {
             "results": results,
             "query": q,
+            "suggestion": suggestion,
+            "facets": facets,
             "pagination": pagination,
         },
     )
 
 
+@app.get("/api/autocomplete")
+async def api_autocomplete(
+    q: str = "", limit: int = 8, session: AsyncSession = Depends(get_session)
+):
+    """Suggestions for the header search box"""
+    return await db.autocomplete(q, limit=min(limit, 20), session=session)
+
+
+@app.get("/api/admin/cache-stats")
+async def api_cache_stats(request: Request):
+    """Hit/miss counters of the read-through caches and the page cache"""
+    if not is_authenticated(request):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {**read_cache_stats(), "pages": await run_in_threadpool(page_cache_stats)}
+
+
 @app.delete("/api/posts/{post_id}")
-async def api_delete_post(post_id: int):
-    success = db.delete_post(post_id)
+async def api_delete_post(post_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_post(post_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Post not found")
     return {"message": "Post deleted successfully"}
@@ -201,8 +550,8 @@ async def api_delete_post(post_id: int):
 
 # Page routes
 @app.get("/admin/pages", response_class=HTMLResponse)
-async def admin_pages(request: Request):
-    pages = db.get_pages(published_only=False)
+async def admin_pages(request: Request, session: AsyncSession = Depends(get_session)):
+    pages = await db.get_pages(published_only=False, session=session)
     return templates.TemplateResponse(
         "admin_pages.html",
         {
@@ -223,25 +572,30 @@ async def create_page(
     slug: str = Form(...),
     content: str = Form(...),
     is_published: bool = Form(False),
+    session: AsyncSession = Depends(get_session),
 ):
     page_data = PageCreate(
         title=title, slug=slug, content=content, is_published=is_published
     )
-    db.create_page(page_data)
+    await db.create_page(page_data, session=session)
     return RedirectResponse(url="/admin/pages", status_code=303)
 
 
 @app.get("/pages/{slug}", response_class=HTMLResponse)
-async def get_page(request: Request, slug: str):
-    page = db.get_page_by_slug(slug)
+async def get_page(
+    request: Request, slug: str, session: AsyncSession = Depends(get_session)
+):
+    page = await db.get_page_by_slug(slug, session=session)
     if not page or not page.is_published:
         raise HTTPException(status_code=404, detail="Page not found")
-    return render_template(request, "page.html", {"page": page})
+    return await render_template(request, "page.html", {"page": page})
 
 
 @app.get("/admin/pages/{page_id}/edit", response_class=HTMLResponse)
-async def edit_page_form(request: Request, page_id: int):
-    page = db.get_page(page_id)
+async def edit_page_form(
+    request: Request, page_id: int, session: AsyncSession = Depends(get_session)
+):
+    page = await db.get_page(page_id, session=session)
     if not page:
         raise HTTPException(status_code=404, detail="Page not found")
     return templates.TemplateResponse(
@@ -256,19 +610,20 @@ async def update_page(
     slug: str = Form(...),
     content: str = Form(...),
     is_published: bool = Form(False),
+    session: AsyncSession = Depends(get_session),
 ):
     page_data = PageUpdate(
         title=title, slug=slug, content=content, is_published=is_published
     )
-    success = db.update_page(page_id, page_data)
+    success = await db.update_page(page_id, page_data, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Page not found")
     return RedirectResponse(url="/admin/pages", status_code=303)
 
 
 @app.post("/admin/pages/{page_id}/delete")
-async def delete_page(page_id: int):
-    success = db.delete_page(page_id)
+async def delete_page(page_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_page(page_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Page not found")
     return RedirectResponse(url="/admin/pages", status_code=303)
@@ -277,7 +632,10 @@ async def delete_page(page_id: int):
 # Railway Routes - Lines
 @app.get("/lines", response_class=HTMLResponse)
 async def list_lines(
-    request: Request, type: Optional[str] = None, status: Optional[str] = None
+    request: Request,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
 ):
     # Map 'type' parameter to 'gauge_type' for database query
     gauge_type = None
@@ -296,8 +654,10 @@ async def list_lines(
         status_map = {"cerrada": "cerrada", "active": "active"}
         line_status = status_map.get(status, status)
 
-    lines = db.get_lines(gauge_type=gauge_type, status=line_status)
-    return render_template(
+    lines = await db.get_lines(
+        gauge_type=gauge_type, status=line_status, session=session
+    )
+    return await render_template(
         request,
         "lines.html",
         {
@@ -315,11 +675,13 @@ async def lines_new_redirect(request: Request):
 
 
 @app.get("/lines/{line_id}", response_class=HTMLResponse)
-async def get_line(request: Request, line_id: int):
-    line = db.get_line(line_id)
+async def get_line(
+    request: Request, line_id: int, session: AsyncSession = Depends(get_session)
+):
+    line = await db.get_line(line_id, session=session)
     if not line:
         raise HTTPException(status_code=404, detail="Line not found")
-    return render_template(request, "line.html", {"line": line})
+    return await render_template(request, "line.html", {"line": line})
 
 
 # Railway Routes - Stations
@@ -329,6 +691,8 @@ async def list_stations(
     type: Optional[str] = None,
     city_id: Optional[int] = None,
     province: Optional[str] = None,
+    name: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
 ):
     # Map 'type' parameter to 'station_type'
     station_type = None
@@ -336,23 +700,26 @@ async def list_stations(
         type_map = {"principal": "principal", "regional": "regional", "local": "local"}
         station_type = type_map.get(type)
 
-    stations = db.get_stations(
-        station_type=station_type, city_id=city_id, province=province
+    stations = await db.get_stations(
+        station_type=station_type,
+        city_id=city_id,
+        province=province,
+        name=name,
+        session=session,
     )
 
-    # Add city names to each station
+    # Add city names to each station (one lookup for the whole page)
+    cities = await db.get_cities_by_ids(
+        [station.city_id for station in stations], session=session
+    )
     stations_with_names = []
     for station in stations:
         station_dict = station.model_dump()
-        city_name = None
-        if station.city_id:
-            city = db.get_city(station.city_id)
-            if city:
-                city_name = city.name
-        station_dict["city_name"] = city_name
+        city = cities.get(station.city_id)
+        station_dict["city_name"] = city.name if city else None
         stations_with_names.append(station_dict)
 
-    return render_template(
+    return await render_template(
         request,
         "stations.html",
         {
@@ -371,15 +738,17 @@ async def stations_new_redirect(request: Request):
 
 
 @app.get("/stations/{station_id}", response_class=HTMLResponse)
-async def get_station(request: Request, station_id: int):
-    station = db.get_station(station_id)
+async def get_station(
+    request: Request, station_id: int, session: AsyncSession = Depends(get_session)
+):
+    station = await db.get_station(station_id, session=session)
     if not station:
         raise HTTPException(status_code=404, detail="Station not found")
 
     # Get city name if it exists
     city_name = None
     if station.city_id:
-        city = db.get_city(station.city_id)
+        city = await db.get_city(station.city_id, session=session)
         if city:
             city_name = city.name
 
@@ -387,12 +756,16 @@ async def get_station(request: Request, station_id: int):
     station_dict = station.model_dump()
     station_dict["city_name"] = city_name
 
-    return render_template(request, "station.html", {"station": station_dict})
+    return await render_template(request, "station.html", {"station": station_dict})
 
 
 # Railway Routes - Projects
 @app.get("/projects", response_class=HTMLResponse)
-async def list_projects(request: Request, status: Optional[str] = None):
+async def list_projects(
+    request: Request,
+    status: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+):
     # Map status parameter values
     project_status = None
     if status:
@@ -409,27 +782,25 @@ async def list_projects(request: Request, status: Optional[str] = None):
         }
         project_status = status_map.get(status, status)
 
-    projects = db.get_projects(status=project_status)
+    projects = await db.get_projects(status=project_status, session=session)
 
-    # Add category and city names to each project
+    # Add category and city names to each project (one lookup each for the page)
+    categories = await db.get_categories_by_ids(
+        [project.category_id for project in projects], session=session
+    )
+    cities = await db.get_cities_by_ids(
+        [project.city_id for project in projects], session=session
+    )
     projects_with_names = []
     for project in projects:
         project_dict = project.model_dump()
-        category_name = None
-        city_name = None
-        if project.category_id:
-            category = db.get_category(project.category_id)
-            if category:
-                category_name = category.name
-        if project.city_id:
-            city = db.get_city(project.city_id)
-            if city:
-                city_name = city.name
-        project_dict["category_name"] = category_name
-        project_dict["city_name"] = city_name
+        category = categories.get(project.category_id)
+        city = cities.get(project.city_id)
+        project_dict["category_name"] = category.name if category else None
+        project_dict["city_name"] = city.name if city else None
         projects_with_names.append(project_dict)
 
-    return render_template(
+    return await render_template(
         request,
         "projects.html",
         {
@@ -446,8 +817,10 @@ async def projects_new_redirect(request: Request):
 
 
 @app.get("/projects/{project_id}", response_class=HTMLResponse)
-async def get_project(request: Request, project_id: int):
-    project = db.get_project(project_id)
+async def get_project(
+    request: Request, project_id: int, session: AsyncSession = Depends(get_session)
+):
+    project = await db.get_project(project_id, session=session)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
@@ -455,11 +828,11 @@ async def get_project(request: Request, project_id: int):
     category_name = None
     city_name = None
     if project.category_id:
-        category = db.get_category(project.category_id)
+        category = await db.get_category(project.category_id, session=session)
         if category:
             category_name = category.name
     if project.city_id:
-        city = db.get_city(project.city_id)
+        city = await db.get_city(project.city_id, session=session)
         if city:
             city_name = city.name
 
@@ -468,13 +841,36 @@ async def get_project(request: Request, project_id: int):
     project_dict["category_name"] = category_name
     project_dict["city_name"] = city_name
 
-    return render_template(request, "project.html", {"project": project_dict})
+    return await render_template(request, "project.html", {"project": project_dict})
+
+
+@app.get("/events/{event_id}", response_class=HTMLResponse)
+async def get_event(
+    request: Request, event_id: int, session: AsyncSession = Depends(get_session)
+):
+    event = await db.get_event(event_id, session=session)
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    # Add the city name to the event object for the template
+    event_dict = event.model_dump()
+    event_dict["city_name"] = None
+    if event.city_id:
+        city = await db.get_city(event.city_id, session=session)
+        if city:
+            event_dict["city_name"] = city.name
+
+    return await render_template(request, "event.html", {"event": event_dict})
 
 
 # Railway Routes - Cities
 @app.get("/cities", response_class=HTMLResponse)
-async def list_cities(request: Request, name: Optional[str] = None):
-    cities = db.get_cities(name=name)
+async def list_cities(
+    request: Request,
+    name: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+):
+    cities = await db.get_cities(name=name, session=session)
 
     # If a city name is provided, get related content
     related_lines = []
@@ -483,22 +879,19 @@ async def list_cities(request: Request, name: Optional[str] = None):
 
     if name:
         # Get city by name to get its ID
-        city_list = db.get_cities(name=name, skip=0, limit=1)
+        city_list = await db.get_cities(name=name, skip=0, limit=1, session=session)
         if city_list:
             city = city_list[0]
             # Get related content
-            all_lines = db.get_lines()
-            related_lines = [
-                line for line in all_lines if city.name in (line.cities_served or [])
-            ]
+            related_lines = await db.get_lines_by_city(city.id, session=session)
 
-            all_stations = db.get_stations(city_id=city.id)
+            all_stations = await db.get_stations(city_id=city.id, session=session)
             related_stations = all_stations
 
-            all_projects = db.get_projects()
+            all_projects = await db.get_projects(session=session)
             related_projects = [p for p in all_projects if p.city_id == city.id]
 
-    return render_template(
+    return await render_template(
         request,
         "cities.html",
         {
@@ -512,39 +905,45 @@ async def list_cities(request: Request, name: Optional[str] = None):
 
 
 @app.get("/cities/{slug}", response_class=HTMLResponse)
-async def get_city(request: Request, slug: str):
+async def get_city(
+    request: Request, slug: str, session: AsyncSession = Depends(get_session)
+):
     # Try to get by slug first, then by ID if slug is numeric
     city = None
     if slug.isdigit():
-        city = db.get_city(int(slug))
+        city = await db.get_city(int(slug), session=session)
     else:
-        city = db.get_city_by_slug(slug)
+        city = await db.get_city_by_slug(slug, session=session)
 
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
-    return render_template(request, "city.html", {"city": city})
+    return await render_template(request, "city.html", {"city": city})
 
 
 # Railway Routes - Categories
 @app.get("/categories", response_class=HTMLResponse)
-async def list_categories(request: Request):
-    categories = db.get_categories()
-    return render_template(request, "categories.html", {"categories": categories})
+async def list_categories(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
+    categories = await db.get_categories(session=session)
+    return await render_template(request, "categories.html", {"categories": categories})
 
 
 @app.get("/categories/{category_id}", response_class=HTMLResponse)
-async def get_category(request: Request, category_id: int):
-    category = db.get_category(category_id)
+async def get_category(
+    request: Request, category_id: int, session: AsyncSession = Depends(get_session)
+):
+    category = await db.get_category(category_id, session=session)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    return render_template(request, "category.html", {"category": category})
+    return await render_template(request, "category.html", {"category": category})
 
 
 # Form Routes - Lines
 @app.get("/admin/lines/new", response_class=HTMLResponse)
-async def new_line_form(request: Request):
-    cities = db.get_cities()
-    categories = db.get_categories()
+async def new_line_form(request: Request, session: AsyncSession = Depends(get_session)):
+    cities = await db.get_cities(session=session)
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "line_form.html",
         {
@@ -557,12 +956,14 @@ async def new_line_form(request: Request):
 
 
 @app.get("/admin/lines/{line_id}/edit", response_class=HTMLResponse)
-async def edit_line_form(request: Request, line_id: int):
-    line = db.get_line(line_id)
+async def edit_line_form(
+    request: Request, line_id: int, session: AsyncSession = Depends(get_session)
+):
+    line = await db.get_line(line_id, session=session)
     if not line:
         raise HTTPException(status_code=404, detail="Line not found")
-    cities = db.get_cities()
-    categories = db.get_categories()
+    cities = await db.get_cities(session=session)
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "line_form.html",
         {
@@ -582,6 +983,7 @@ async def create_line(
     gauge_type: str = Form(None),
     cities_served: str = Form(""),
     category_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     cities = (
         [city.strip() for city in cities_served.split(",") if city.strip()]
@@ -596,7 +998,7 @@ async def create_line(
         cities_served=cities,
         category_id=category_id,
     )
-    line = db.create_line(line_data)
+    line = await db.create_line(line_data, session=session)
     return RedirectResponse(url=f"/lines/{line.id}", status_code=303)
 
 
@@ -609,6 +1011,7 @@ async def update_line(
     gauge_type: str = Form(None),
     cities_served: str = Form(""),
     category_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     cities = (
         [city.strip() for city in cities_served.split(",") if city.strip()]
@@ -623,15 +1026,15 @@ async def update_line(
         cities_served=cities,
         category_id=category_id,
     )
-    line = db.update_line(line_id, line_data)
+    line = await db.update_line(line_id, line_data, session=session)
     if not line:
         raise HTTPException(status_code=404, detail="Line not found")
     return RedirectResponse(url=f"/lines/{line.id}", status_code=303)
 
 
 @app.post("/admin/lines/{line_id}/delete")
-async def delete_line(line_id: int):
-    success = db.delete_line(line_id)
+async def delete_line(line_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_line(line_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Line not found")
     return RedirectResponse(url="/lines", status_code=303)
@@ -639,9 +1042,11 @@ async def delete_line(line_id: int):
 
 # Form Routes - Stations
 @app.get("/admin/stations/new", response_class=HTMLResponse)
-async def new_station_form(request: Request):
-    cities = db.get_cities()
-    categories = db.get_categories()
+async def new_station_form(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
+    cities = await db.get_cities(session=session)
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "station_form.html",
         {
@@ -654,12 +1059,14 @@ async def new_station_form(request: Request):
 
 
 @app.get("/admin/stations/{station_id}/edit", response_class=HTMLResponse)
-async def edit_station_form(request: Request, station_id: int):
-    station = db.get_station(station_id)
+async def edit_station_form(
+    request: Request, station_id: int, session: AsyncSession = Depends(get_session)
+):
+    station = await db.get_station(station_id, session=session)
     if not station:
         raise HTTPException(status_code=404, detail="Station not found")
-    cities = db.get_cities()
-    categories = db.get_categories()
+    cities = await db.get_cities(session=session)
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "station_form.html",
         {
@@ -681,6 +1088,7 @@ async def create_station(
     station_type: Optional[str] = Form(None),
     province: Optional[str] = Form(None),
     city_id: Optional[int] = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     services_list = (
         [service.strip() for service in services.split(",") if service.strip()]
@@ -702,7 +1110,7 @@ async def create_station(
         province=province if province else None,
         city_id=city_id,
     )
-    station = db.create_station(station_data)
+    station = await db.create_station(station_data, session=session)
     return RedirectResponse(url=f"/stations/{station.id}", status_code=303)
 
 
@@ -717,6 +1125,7 @@ async def update_station(
     station_type: Optional[str] = Form(None),
     province: Optional[str] = Form(None),
     city_id: Optional[int] = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     services_list = (
         [service.strip() for service in services.split(",") if service.strip()]
@@ -738,15 +1147,15 @@ async def update_station(
         province=province if province else None,
         city_id=city_id,
     )
-    station = db.update_station(station_id, station_data)
+    station = await db.update_station(station_id, station_data, session=session)
     if not station:
         raise HTTPException(status_code=404, detail="Station not found")
     return RedirectResponse(url=f"/stations/{station.id}", status_code=303)
 
 
 @app.post("/admin/stations/{station_id}/delete")
-async def delete_station(station_id: int):
-    success = db.delete_station(station_id)
+async def delete_station(station_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_station(station_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Station not found")
     return RedirectResponse(url="/stations", status_code=303)
@@ -754,9 +1163,11 @@ async def delete_station(station_id: int):
 
 # Form Routes - Projects
 @app.get("/admin/projects/new", response_class=HTMLResponse)
-async def new_project_form(request: Request):
-    cities = db.get_cities()
-    categories = db.get_categories()
+async def new_project_form(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
+    cities = await db.get_cities(session=session)
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "project_form.html",
         {
@@ -769,12 +1180,14 @@ async def new_project_form(request: Request):
 
 
 @app.get("/admin/projects/{project_id}/edit", response_class=HTMLResponse)
-async def edit_project_form(request: Request, project_id: int):
-    project = db.get_project(project_id)
+async def edit_project_form(
+    request: Request, project_id: int, session: AsyncSession = Depends(get_session)
+):
+    project = await db.get_project(project_id, session=session)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    cities = db.get_cities()
-    categories = db.get_categories()
+    cities = await db.get_cities(session=session)
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "project_form.html",
         {
@@ -796,6 +1209,7 @@ async def create_project(
     status: str = Form("planning"),
     city_id: int = Form(None),
     category_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     project_data = ProjectCreate(
         title=title,
@@ -807,7 +1221,7 @@ async def create_project(
         city_id=city_id,
         category_id=category_id,
     )
-    project = db.create_project(project_data)
+    project = await db.create_project(project_data, session=session)
     return RedirectResponse(url=f"/projects/{project.id}", status_code=303)
 
 
@@ -822,6 +1236,7 @@ async def update_project(
     status: str = Form("planning"),
     city_id: int = Form(None),
     category_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     project_data = ProjectUpdate(
         title=title,
@@ -833,15 +1248,15 @@ async def update_project(
         city_id=city_id,
         category_id=category_id,
     )
-    project = db.update_project(project_id, project_data)
+    project = await db.update_project(project_id, project_data, session=session)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return RedirectResponse(url=f"/projects/{project.id}", status_code=303)
 
 
 @app.post("/admin/projects/{project_id}/delete")
-async def delete_project(project_id: int):
-    success = db.delete_project(project_id)
+async def delete_project(project_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_project(project_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Project not found")
     return RedirectResponse(url="/projects", status_code=303)
@@ -849,9 +1264,11 @@ async def delete_project(project_id: int):
 
 # Form Routes - Events
 @app.get("/admin/events/new", response_class=HTMLResponse)
-async def new_event_form(request: Request):
-    cities = db.get_cities()
-    lineas = db.get_lines()
+async def new_event_form(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
+    cities = await db.get_cities(session=session)
+    lineas = await db.get_lines(session=session)
     return templates.TemplateResponse(
         "event_form.html",
         {
@@ -864,12 +1281,14 @@ async def new_event_form(request: Request):
 
 
 @app.get("/admin/events/{event_id}/edit", response_class=HTMLResponse)
-async def edit_event_form(request: Request, event_id: int):
-    event = db.get_event(event_id)
+async def edit_event_form(
+    request: Request, event_id: int, session: AsyncSession = Depends(get_session)
+):
+    event = await db.get_event(event_id, session=session)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
-    cities = db.get_cities()
-    lineas = db.get_lines()
+    cities = await db.get_cities(session=session)
+    lineas = await db.get_lines(session=session)
     return templates.TemplateResponse(
         "event_form.html",
         {
@@ -890,6 +1309,7 @@ async def create_event(
     location: str = Form(...),
     event_type: str = Form(...),
     city_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     from datetime import datetime
 
@@ -902,7 +1322,7 @@ async def create_event(
         event_type=event_type,
         city_id=city_id,
     )
-    event = db.create_event(event_data)
+    event = await db.create_event(event_data, session=session)
     return RedirectResponse(url="/posts/eventos", status_code=303)
 
 
@@ -916,6 +1336,7 @@ async def update_event(
     location: str = Form(...),
     event_type: str = Form(...),
     city_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     from datetime import datetime
 
@@ -928,15 +1349,15 @@ async def update_event(
         event_type=event_type,
         city_id=city_id,
     )
-    event = db.update_event(event_id, event_data)
+    event = await db.update_event(event_id, event_data, session=session)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     return RedirectResponse(url="/posts/eventos", status_code=303)
 
 
 @app.post("/admin/events/{event_id}/delete")
-async def delete_event(event_id: int):
-    success = db.delete_event(event_id)
+async def delete_event(event_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_event(event_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Event not found")
     return RedirectResponse(url="/posts/eventos", status_code=303)
@@ -955,8 +1376,10 @@ async def new_city_form(request: Request):
 
 
 @app.get("/admin/cities/{city_id}/edit", response_class=HTMLResponse)
-async def edit_city_form(request: Request, city_id: int):
-    city = db.get_city(city_id)
+async def edit_city_form(
+    request: Request, city_id: int, session: AsyncSession = Depends(get_session)
+):
+    city = await db.get_city(city_id, session=session)
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
     return templates.TemplateResponse(
@@ -974,6 +1397,7 @@ async def create_city(
     slug: str = Form(...),
     region: str = Form(""),
     country: str = Form("Spain"),
+    session: AsyncSession = Depends(get_session),
 ):
     city_data = CityCreate(
         name=name,
@@ -981,7 +1405,7 @@ async def create_city(
         region=region,
         country=country,
     )
-    city = db.create_city(city_data)
+    city = await db.create_city(city_data, session=session)
     return RedirectResponse(url=f"/cities/{city.slug}", status_code=303)
 
 
@@ -992,6 +1416,7 @@ async def update_city(
     slug: str = Form(...),
     region: str = Form(""),
     country: str = Form("Spain"),
+    session: AsyncSession = Depends(get_session),
 ):
     city_data = CityUpdate(
         name=name,
@@ -999,15 +1424,15 @@ async def update_city(
         region=region,
         country=country,
     )
-    city = db.update_city(city_id, city_data)
+    city = await db.update_city(city_id, city_data, session=session)
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
     return RedirectResponse(url=f"/cities/{city.slug}", status_code=303)
 
 
 @app.post("/admin/cities/{city_id}/delete")
-async def delete_city(city_id: int):
-    success = db.delete_city(city_id)
+async def delete_city(city_id: int, session: AsyncSession = Depends(get_session)):
+    success = await db.delete_city(city_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="City not found")
     return RedirectResponse(url="/cities", status_code=303)
@@ -1015,8 +1440,10 @@ async def delete_city(city_id: int):
 
 # Form Routes - Categories
 @app.get("/admin/categories/new", response_class=HTMLResponse)
-async def new_category_form(request: Request):
-    categories = db.get_categories()
+async def new_category_form(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "category_form.html",
         {
@@ -1028,11 +1455,13 @@ async def new_category_form(request: Request):
 
 
 @app.get("/admin/categories/{category_id}/edit", response_class=HTMLResponse)
-async def edit_category_form(request: Request, category_id: int):
-    category = db.get_category(category_id)
+async def edit_category_form(
+    request: Request, category_id: int, session: AsyncSession = Depends(get_session)
+):
+    category = await db.get_category(category_id, session=session)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    categories = db.get_categories()
+    categories = await db.get_categories(session=session)
     return templates.TemplateResponse(
         "category_form.html",
         {
@@ -1049,6 +1478,7 @@ async def create_category(
     slug: str = Form(...),
     description: str = Form(""),
     parent_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     category_data = CategoryCreate(
         name=name,
@@ -1056,7 +1486,7 @@ async def create_category(
         description=description,
         parent_id=parent_id,
     )
-    category = db.create_category(category_data)
+    category = await db.create_category(category_data, session=session)
     return RedirectResponse(url=f"/categories/{category.id}", status_code=303)
 
 
@@ -1067,6 +1497,7 @@ async def update_category(
     slug: str = Form(...),
     description: str = Form(""),
     parent_id: int = Form(None),
+    session: AsyncSession = Depends(get_session),
 ):
     category_data = CategoryUpdate(
         name=name,
@@ -1074,15 +1505,17 @@ async def update_category(
         description=description,
         parent_id=parent_id,
     )
-    category = db.update_category(category_id, category_data)
+    category = await db.update_category(category_id, category_data, session=session)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return RedirectResponse(url=f"/categories/{category.id}", status_code=303)
 
 
 @app.post("/admin/categories/{category_id}/delete")
-async def delete_category(category_id: int):
-    success = db.delete_category(category_id)
+async def delete_category(
+    category_id: int, session: AsyncSession = Depends(get_session)
+):
+    success = await db.delete_category(category_id, session=session)
     if not success:
         raise HTTPException(status_code=404, detail="Category not found")
     return RedirectResponse(url="/categories", status_code=303)
@@ -1090,9 +1523,11 @@ async def delete_category(category_id: int):
 
 # Admin listing routes for railway entities
 @app.get("/admin/lines", response_class=HTMLResponse)
-async def admin_list_lines(request: Request):
+async def admin_list_lines(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
     try:
-        lines = db.get_lines()
+        lines = await db.get_lines(session=session)
     except:
         lines = []
     return templates.TemplateResponse(
@@ -1105,9 +1540,11 @@ async def admin_list_lines(request: Request):
 
 
 @app.get("/admin/stations", response_class=HTMLResponse)
-async def admin_list_stations(request: Request):
+async def admin_list_stations(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
     try:
-        stations = db.get_stations()
+        stations = await db.get_stations(session=session)
     except:
         stations = []
     return templates.TemplateResponse(
@@ -1120,9 +1557,11 @@ async def admin_list_stations(request: Request):
 
 
 @app.get("/admin/projects", response_class=HTMLResponse)
-async def admin_list_projects(request: Request):
+async def admin_list_projects(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
     try:
-        projects = db.get_projects()
+        projects = await db.get_projects(session=session)
     except:
         projects = []
     return templates.TemplateResponse(
@@ -1135,9 +1574,11 @@ async def admin_list_projects(request: Request):
 
 
 @app.get("/admin/events", response_class=HTMLResponse)
-async def admin_list_events(request: Request):
+async def admin_list_events(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
     try:
-        events = db.get_events()
+        events = await db.get_events(session=session)
     except:
         events = []
     return templates.TemplateResponse(
@@ -1150,9 +1591,11 @@ async def admin_list_events(request: Request):
 
 
 @app.get("/admin/cities", response_class=HTMLResponse)
-async def admin_list_cities(request: Request):
+async def admin_list_cities(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
     try:
-        cities = db.get_cities()
+        cities = await db.get_cities(session=session)
     except:
         cities = []
     return templates.TemplateResponse(
@@ -1165,9 +1608,11 @@ async def admin_list_cities(request: Request):
 
 
 @app.get("/admin/categories", response_class=HTMLResponse)
-async def admin_list_categories(request: Request):
+async def admin_list_categories(
+    request: Request, session: AsyncSession = Depends(get_session)
+):
     try:
-        categories = db.get_categories()
+        categories = await db.get_categories(session=session)
     except:
         categories = []
     return templates.TemplateResponse(
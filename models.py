@@ -34,6 +34,22 @@ class PostUpdate(BaseModel):
 class Post(PostBase):
     id: int
     category: Optional[PostCategory] = None
+    excerpt: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class PostSummary(BaseModel):
+    """Post without its content, for listings"""
+    id: int
+    title: str
+    author: str
+    is_published: bool = True
+    category: Optional[PostCategory] = None
+    excerpt: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -110,7 +126,7 @@ class StationBase(BaseModel):
     province: Optional[str] = None
     city_id: Optional[int] = None
     services: List[str] = []
-    accessibility: bool = False
+    accessibility: List[str] = []
     category_id: Optional[int] = None
 
 
@@ -126,7 +142,7 @@ class StationUpdate(BaseModel):
     province: Optional[str] = None
     city_id: Optional[int] = None
     services: Optional[List[str]] = None
-    accessibility: Optional[bool] = None
+    accessibility: Optional[List[str]] = None
     category_id: Optional[int] = None
 
 
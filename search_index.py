@@ -0,0 +1,626 @@
+"""
+In-process indexes for the site search and autocomplete.
+
+Text is folded to lowercase without accents ("Córdoba" -> "cordoba"),
+split into words, stripped of Spanish stop words and lightly stemmed
+(plurals), so "estaciones" finds "Estación". Documents are ranked with
+BM25, with title words counted more than body words. PrefixIndex answers
+autocomplete lookups from a sorted array, TrigramIndex substring and
+typo-tolerant name lookups, and SpellingIndex "did you mean" corrections.
+
+The index knows nothing about the database: BlogDatabase builds Document
+objects from its rows and keeps the index up to date as content changes.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+STOP_WORDS = frozenset(
+    "a al con de del el en es la las lo los o para por que se su sus un una "
+    "unas unos y".split()
+)
+
+_WORD_RE = re.compile(r"\w+")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# BM25 parameters and the weight of a title occurrence relative to the body
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+
+
+def fold(text: str) -> str:
+    """Lowercase ``text`` and remove accents"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def strip_tags(text: str) -> str:
+    """Remove HTML tags from ``text``"""
+    return _TAG_RE.sub(" ", text)
+
+
+def stem(word: str) -> str:
+    """Light Spanish stemming: reduce plurals to the singular"""
+    if len(word) > 4 and word.endswith("es") and word[-3] not in "aeiou":
+        return word[:-2]  # estaciones -> estacion, ciudades -> ciudad
+    if len(word) > 3 and word.endswith("s") and word[-2] in "aeiou":
+        return word[:-1]  # lineas -> linea, vias -> via
+    return word
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Index terms of ``text``, in order"""
+    if not text:
+        return []
+    return [
+        stem(word) for word in _WORD_RE.findall(fold(text)) if word not in STOP_WORDS
+    ]
+
+
+class Document(NamedTuple):
+    """Something the index can find"""
+
+    key: Hashable  # e.g. ("post", 12)
+    title: str
+    body: str
+    data: dict  # returned with the hit, e.g. a search result dict
+    date: Optional[object] = None  # tie-breaker, newest first
+
+
+def _rank(hit: Tuple[float, Document]):
+    """Sort key for hits: score, then newest (undated last)"""
+    score, document = hit
+    return score, document.date is not None, document.date or 0
+
+
+class IncrementalIndex:
+    """Base for in-memory indexes over Documents, safe to share between threads.
+
+    ``ensure_built`` fills the index once; ``add``/``remove`` keep it current
+    afterwards. Changes made while a build is loading are replayed once it
+    finishes, and ignored before the first build (which will see them).
+    Subclasses implement ``_reset``, ``_add`` and ``_remove``, called with
+    ``_lock`` held, and may override ``_build`` to load many documents at
+    once faster than one ``_add`` at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._building = False
+        self._pending: List[Tuple[str, Hashable, Optional[Document]]] = []
+        self._reset()
+
+    def _reset(self):
+        self._documents: Dict[Hashable, Document] = {}
+
+    def _add(self, document: Document):
+        raise NotImplementedError
+
+    def _remove(self, key: Hashable):
+        raise NotImplementedError
+
+    def _build(self, documents: List[Document]):
+        for document in documents:
+            self._add(document)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def ensure_built(self, loader: Callable[[], Iterable[Document]]):
+        """Build the index from ``loader()`` if that hasn't happened yet"""
+        if self._built:
+            return
+        with self._build_lock:
+            if self._built:
+                return
+            with self._lock:
+                self._building = True
+                self._pending = []
+            try:
+                # Load without holding _lock so writers aren't blocked meanwhile
+                documents = list(loader())
+                with self._lock:
+                    self._reset()
+                    self._build(documents)
+                    # Replay writes that committed while we were loading
+                    for action, key, document in self._pending:
+                        self._remove(key)
+                        if action == "add":
+                            self._add(document)
+                    self._built = True
+            finally:
+                with self._lock:
+                    self._building = False
+                    self._pending = []
+
+    def invalidate(self):
+        """Forget everything; the next ensure_built() rebuilds"""
+        with self._lock:
+            self._built = False
+            self._reset()
+
+    def add(self, document: Document):
+        """Index ``document``, replacing any document with the same key"""
+        with self._lock:
+            if self._building:
+                self._pending.append(("add", document.key, document))
+            elif self._built:
+                self._remove(document.key)
+                self._add(document)
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            if self._building:
+                self._pending.append(("remove", key, None))
+            elif self._built:
+                self._remove(key)
+
+
+class SearchIndex(IncrementalIndex):
+    """Inverted index with BM25 ranking"""
+
+    def _reset(self):
+        super()._reset()
+        self._terms: Dict[Hashable, Counter] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._total_length = 0
+
+    def _add(self, document: Document):
+        terms = Counter(tokenize(document.body))
+        for term in tokenize(document.title):
+            terms[term] += TITLE_WEIGHT
+        self._documents[document.key] = document
+        self._terms[document.key] = terms
+        self._lengths[document.key] = sum(terms.values())
+        self._total_length += self._lengths[document.key]
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[document.key] = frequency
+
+    def _remove(self, key: Hashable):
+        terms = self._terms.pop(key, None)
+        if terms is None:
+            return
+        del self._documents[key]
+        self._total_length -= self._lengths.pop(key)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+
+    def search(
+        self, query: str, limit: Optional[int] = None
+    ) -> Tuple[List[Tuple[float, Document]], int]:
+        """Documents containing every term of ``query``, best first.
+
+        Returns ``(hits, total)`` where ``hits`` holds at most ``limit``
+        ``(score, document)`` pairs. An empty query matches everything, newest
+        first.
+        """
+        hits, total, _ = self.search_faceted(query, limit)
+        return hits, total
+
+    def search_faceted(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        facets: Optional[Callable[[Document], Iterable[Tuple[str, Hashable]]]] = None,
+    ) -> Tuple[List[Tuple[float, Document]], int, Dict[str, Counter]]:
+        """Like ``search``, also counting facet values over every match.
+
+        ``facets(document)`` yields the ``(facet, value)`` pairs of a
+        document; the counts are gathered in the same pass that collects
+        the hits, as ``{facet: Counter(value -> matches)}``.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        counts: Dict[str, Counter] = {}
+        with self._lock:
+            if not terms:
+                matches = {key: 0.0 for key in self._documents}
+            else:
+                matches = self._score(terms)
+            hits = []
+            for key, score in matches.items():
+                document = self._documents[key]
+                hits.append((score, document))
+                if facets is not None:
+                    for facet, value in facets(document):
+                        counts.setdefault(facet, Counter())[value] += 1
+        if limit is None:
+            hits.sort(key=_rank, reverse=True)
+        else:
+            hits = heapq.nlargest(limit, hits, key=_rank)
+        return hits, len(matches), counts
+
+    def _score(self, terms: List[str]) -> Dict[Hashable, float]:
+        postings = [self._postings.get(term) for term in terms]
+        if not all(postings):
+            return {}
+        # Intersect starting from the rarest term
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return {}
+
+        count = len(self._documents)
+        average_length = self._total_length / count or 1
+        scores = dict.fromkeys(candidates, 0.0)
+        for posting in postings:
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for key in candidates:
+                frequency = posting[key]
+                length = self._lengths[key]
+                scores[key] += (
+                    idf
+                    * frequency
+                    * (K1 + 1)
+                    / (frequency + K1 * (1 - B + B * length / average_length))
+                )
+        return scores
+
+
+class PrefixIndex(IncrementalIndex):
+    """Sorted-array prefix index for autocomplete.
+
+    Every word-aligned suffix of a document's title ("estacion cordoba",
+    "cordoba") and every word of its body (codes, numbers) is kept, folded,
+    in one sorted list; a lookup is a bisect plus a short forward scan.
+    """
+
+    # Distinct documents gathered per lookup before ranking them
+    SCAN_LIMIT = 50
+
+    def _reset(self):
+        super()._reset()
+        self._entries: List[Tuple[str, Hashable]] = []
+        self._texts: Dict[Hashable, List[str]] = {}
+
+    def _store(self, document: Document) -> List[str]:
+        """Record ``document`` and return its texts, not yet in _entries"""
+        words = _WORD_RE.findall(fold(document.title))
+        texts = {" ".join(words[i:]) for i in range(len(words))}
+        texts.update(_WORD_RE.findall(fold(document.body)))
+        self._documents[document.key] = document
+        self._texts[document.key] = list(texts)
+        return self._texts[document.key]
+
+    def _add(self, document: Document):
+        for text in self._store(document):
+            bisect.insort(self._entries, (text, document.key))
+
+    def _build(self, documents: List[Document]):
+        # One sort instead of an insort (shifting the list) per entry
+        for document in documents:
+            self._entries.extend((text, document.key) for text in self._store(document))
+        self._entries.sort()
+
+    def _remove(self, key: Hashable):
+        texts = self._texts.pop(key, None)
+        if texts is None:
+            return
+        del self._documents[key]
+        for text in texts:
+            position = bisect.bisect_left(self._entries, (text, key))
+            del self._entries[position]
+
+    def lookup(self, prefix: str, limit: int = 8) -> List[Document]:
+        """Documents with a title word or body word starting with ``prefix``.
+
+        Titles that start with the prefix come first, then shorter titles.
+        """
+        prefix = " ".join(_WORD_RE.findall(fold(prefix)))
+        if not prefix:
+            return []
+        found: Dict[Hashable, Document] = {}
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (prefix,))
+            while position < len(self._entries) and len(found) < self.SCAN_LIMIT:
+                text, key = self._entries[position]
+                if not text.startswith(prefix):
+                    break
+                found.setdefault(key, self._documents[key])
+                position += 1
+
+        def rank(document: Document):
+            title = " ".join(_WORD_RE.findall(fold(document.title)))
+            return not title.startswith(prefix), len(title), title
+
+        return sorted(found.values(), key=rank)[:limit]
+
+
+def trigrams(text: str) -> set:
+    """Trigrams of ``text`` padded like pg_trgm: two spaces before, one after"""
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: set, b: set) -> float:
+    """Jaccard similarity of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TrigramIndex(IncrementalIndex):
+    """Trigram index over document titles, for substring and fuzzy lookup.
+
+    Titles are folded ("Córdoba" -> "cordoba") and documents with the same
+    folded title share one entry, so thousands of stations in fifty
+    provinces make fifty entries. The words of the titles get trigram
+    postings of their own, so a typo can be matched against one word of a
+    longer title ("avla" ~ "estacion de avila").
+    """
+
+    # Minimum similarity for a fuzzy match ("zaragosa" ~ "zaragoza" is 0.5),
+    # of a whole query word to a title word
+    THRESHOLD = 0.3
+
+    def _reset(self):
+        super()._reset()
+        self._entries: Dict[str, Dict[Hashable, str]] = {}
+        self._trigrams: Dict[str, set] = {}
+        self._postings: Dict[str, set] = {}
+        # Title words -> the titles containing them, their trigrams, and
+        # trigram -> words
+        self._words: Dict[str, set] = {}
+        self._word_trigrams: Dict[str, set] = {}
+        self._word_postings: Dict[str, set] = {}
+
+    @staticmethod
+    def _normalize(text: Optional[str]) -> str:
+        return " ".join(_WORD_RE.findall(fold(text or "")))
+
+    def _add(self, document: Document):
+        text = self._normalize(document.title)
+        self._documents[document.key] = document
+        entry = self._entries.get(text)
+        if entry is None:
+            entry = self._entries[text] = {}
+            self._trigrams[text] = trigrams(text)
+            for trigram in self._trigrams[text]:
+                self._postings.setdefault(trigram, set()).add(text)
+            for word in set(text.split()):
+                titles = self._words.get(word)
+                if titles is None:
+                    titles = self._words[word] = set()
+                    self._word_trigrams[word] = trigrams(word)
+                    for trigram in self._word_trigrams[word]:
+                        self._word_postings.setdefault(trigram, set()).add(word)
+                titles.add(text)
+        entry[document.key] = document.title
+
+    def _remove(self, key: Hashable):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        text = self._normalize(document.title)
+        entry = self._entries[text]
+        del entry[key]
+        if not entry:
+            del self._entries[text]
+            for trigram in self._trigrams.pop(text):
+                postings = self._postings[trigram]
+                postings.discard(text)
+                if not postings:
+                    del self._postings[trigram]
+            for word in set(text.split()):
+                titles = self._words[word]
+                titles.discard(text)
+                if not titles:
+                    del self._words[word]
+                    for trigram in self._word_trigrams.pop(word):
+                        postings = self._word_postings[trigram]
+                        postings.discard(word)
+                        if not postings:
+                            del self._word_postings[trigram]
+
+    def match(self, query: str) -> List[Tuple[float, Dict[Hashable, str]]]:
+        """Entries whose title contains ``query``, or failing that resembles it.
+
+        Returns ``(similarity, {key: title})`` pairs, most similar first; the
+        dicts are the index's own and must not be modified. Matching ignores
+        case and accents. A two-letter query matches the titles with a word
+        starting with it; a one-letter query matches nothing.
+        """
+        text = self._normalize(query)
+        if len(text) < 2:
+            return []
+        query_trigrams = trigrams(text)
+        with self._lock:
+            if len(text) < 3:
+                # " av" follows the padding or a space: a word starts with "av"
+                found = list(self._postings.get(f" {text}", ()))
+                scores = {
+                    title: similarity(query_trigrams, self._trigrams[title])
+                    for title in found
+                }
+            else:
+                # Substring matches: every trigram of the query is in the title
+                inner = [text[i : i + 3] for i in range(len(text) - 2)]
+                postings = sorted(
+                    (self._postings.get(t, set()) for t in inner), key=len
+                )
+                candidates = set(postings[0]).intersection(*postings[1:])
+                scores = {
+                    title: similarity(query_trigrams, self._trigrams[title])
+                    for title in candidates
+                    if text in title
+                }
+                if not scores:
+                    scores = self._word_match(text.split())
+            matches = sorted(scores.items(), key=lambda match: (-match[1], match[0]))
+            return [(score, self._entries[title]) for title, score in matches]
+
+    def _word_match(self, words: List[str]) -> Dict[str, float]:
+        """Titles in which every query word resembles some word, with the
+        mean of those words' similarities"""
+        words = list(dict.fromkeys(words))
+        totals: Dict[str, float] = {}
+        for position, word in enumerate(words):
+            word_trigrams = trigrams(word)
+            shared = Counter()
+            for trigram in word_trigrams:
+                shared.update(self._word_postings.get(trigram, ()))
+            best: Dict[str, float] = {}
+            for candidate, count in shared.items():
+                score = count / (
+                    len(word_trigrams) + len(self._word_trigrams[candidate]) - count
+                )
+                if score < self.THRESHOLD:
+                    continue
+                for title in self._words[candidate]:
+                    # Only titles matching every earlier word stay in the running
+                    if position == 0 or title in totals:
+                        best[title] = max(best.get(title, 0.0), score)
+            totals = {
+                title: totals.get(title, 0.0) + score for title, score in best.items()
+            }
+            if not totals:
+                return {}
+        return {title: total / len(words) for title, total in totals.items()}
+
+
+def _deletes(word: str, distance: int) -> set:
+    """Every string obtained by deleting up to ``distance`` characters"""
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1 :] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, capped at limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if (
+                previous2 is not None
+                and i > 1
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SpellingIndex(IncrementalIndex):
+    """Symmetric-delete (SymSpell) dictionary of the words in document titles.
+
+    Each dictionary word is stored under every variant with up to
+    MAX_DISTANCE characters deleted; a misspelling is looked up through its
+    own deletes, so a correction costs a few dictionary probes instead of a
+    scan. Words are counted per document, so updates and removals keep the
+    dictionary exact.
+    """
+
+    MAX_DISTANCE = 2
+    MIN_LENGTH = 3
+
+    def _reset(self):
+        super()._reset()
+        self._words: Dict[Hashable, List[Tuple[str, str]]] = {}
+        self._counts: Counter = Counter()
+        self._spellings: Dict[str, Counter] = {}
+        self._variants: Dict[str, set] = {}
+
+    def _split(self, title: str) -> List[Tuple[str, str]]:
+        """(folded, as written) for the correctable words of ``title``"""
+        words = []
+        for word in _WORD_RE.findall(title or ""):
+            folded = fold(word)
+            if len(folded) >= self.MIN_LENGTH and not folded.isdigit():
+                words.append((folded, word))
+        return words
+
+    def _add(self, document: Document):
+        words = self._split(document.title)
+        self._documents[document.key] = document
+        self._words[document.key] = words
+        for folded, written in words:
+            if not self._counts[folded]:
+                for variant in _deletes(folded, self.MAX_DISTANCE):
+                    self._variants.setdefault(variant, set()).add(folded)
+            self._counts[folded] += 1
+            self._spellings.setdefault(folded, Counter())[written] += 1
+
+    def _remove(self, key: Hashable):
+        words = self._words.pop(key, None)
+        if words is None:
+            return
+        del self._documents[key]
+        for folded, written in words:
+            self._counts[folded] -= 1
+            self._spellings[folded][written] -= 1
+            if self._counts[folded]:
+                continue
+            del self._counts[folded], self._spellings[folded]
+            for variant in _deletes(folded, self.MAX_DISTANCE):
+                words_for_variant = self._variants[variant]
+                words_for_variant.discard(folded)
+                if not words_for_variant:
+                    del self._variants[variant]
+
+    def correct_word(self, word: str) -> Optional[str]:
+        """The closest, most frequent dictionary word, as usually written"""
+        folded = fold(word)
+        with self._lock:
+            if self._counts.get(folded):
+                return None
+            candidates = set()
+            for variant in _deletes(folded, self.MAX_DISTANCE):
+                candidates.update(self._variants.get(variant, ()))
+            best = None
+            for candidate in candidates:
+                distance = edit_distance(folded, candidate, self.MAX_DISTANCE)
+                if distance > self.MAX_DISTANCE:
+                    continue
+                rank = (distance, -self._counts[candidate], candidate)
+                if best is None or rank < best:
+                    best = rank
+            if best is None:
+                return None
+            return self._spellings[best[2]].most_common(1)[0][0]
+
+    def suggest(self, query: str) -> Optional[str]:
+        """``query`` with its unknown words corrected, or None if none could be"""
+        changed = False
+        words = []
+        for word in _WORD_RE.findall(query):
+            correction = None
+            if len(word) >= self.MIN_LENGTH and not word.isdigit():
+                correction = self.correct_word(word)
+            if correction:
+                changed = True
+            words.append(correction or word)
+        return " ".join(words) if changed else None
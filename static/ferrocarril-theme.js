@@ -46,6 +46,13 @@
             }
         });
 
+        // Header search autocomplete
+        const searchInput = document.getElementById('searchInput');
+        const searchResults = document.getElementById('searchResults');
+        if (searchInput && searchResults) {
+            setupAutocomplete(searchInput, searchResults);
+        }
+
         // Smooth scroll for anchor links
         const anchorLinks = document.querySelectorAll('a[href^="#"]');
         anchorLinks.forEach(function(link) {
@@ -109,6 +116,74 @@
         }
     });
 
+    // Suggest stations, cities and lines from /api/autocomplete while typing
+    function setupAutocomplete(input, results) {
+        const typeLabels = { station: 'Estación', city: 'Ciudad', line: 'Línea' };
+        let timer = null;
+        let lastQuery = '';
+
+        function close() {
+            results.classList.remove('open');
+            results.innerHTML = '';
+        }
+
+        function render(suggestions) {
+            results.innerHTML = '';
+            if (!suggestions.length) {
+                close();
+                return;
+            }
+            suggestions.forEach(function(suggestion) {
+                const link = document.createElement('a');
+                link.href = suggestion.url;
+                link.className = 'search-suggestion';
+                const label = document.createElement('span');
+                label.textContent = suggestion.label;
+                const type = document.createElement('small');
+                type.textContent = typeLabels[suggestion.type] || '';
+                link.appendChild(label);
+                link.appendChild(type);
+                results.appendChild(link);
+            });
+            results.classList.add('open');
+        }
+
+        input.setAttribute('autocomplete', 'off');
+        input.addEventListener('input', function() {
+            const query = this.value.trim();
+            clearTimeout(timer);
+            if (query.length < 2) {
+                lastQuery = '';
+                close();
+                return;
+            }
+            timer = setTimeout(function() {
+                lastQuery = query;
+                fetch('/api/autocomplete?q=' + encodeURIComponent(query))
+                    .then(function(response) { return response.json(); })
+                    .then(function(suggestions) {
+                        // Ignore answers to queries the user has typed past
+                        if (query === lastQuery) {
+                            render(suggestions);
+                        }
+                    })
+                    .catch(close);
+            }, 120);
+        });
+
+        input.addEventListener('keydown', function(e) {
+            if (e.key === 'Escape') {
+                close();
+            }
+        });
+
+        document.addEventListener('click', function(e) {
+            if (!results.contains(e.target) && e.target !== input) {
+                close();
+            }
+        });
+    }
+
     // Create table of contents
     function createTableOfContents(headings) {
         const toc = document.createElement('div');